@@ -1,47 +1,717 @@
-from flask import Flask, request, jsonify, send_file, render_template_string
+from flask import Flask, Response, g, request, jsonify, send_file, render_template_string
 import pandas as pd
 import os
 import io
 import json
+import time
+import hashlib
+import hmac
+import functools
+import cProfile
+import pstats
+import tracemalloc
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 import numpy as np
+import zipfile
+import zlib
+import re
+import tempfile
+import shutil
+import pickle
+import sqlite3
+import threading
+import warnings
+import uuid
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from xml.etree import ElementTree
+from xml.parsers import expat
+from xml.sax.saxutils import escape
 
 app = Flask(__name__)
 
-# Store data in memory with currency and module support
-reconciliation_data = {
-    'collections': {
-        'UGX': {'internal': [], 'processors': {}, 'processor_data': []},
-        'NGN': {'internal': [], 'processors': {}, 'processor_data': []},
-        'TZS': {'internal': [], 'processors': {}, 'processor_data': []},
-        'KES': {'internal': [], 'processors': {}, 'processor_data': []},
-        'GHS': {'internal': [], 'processors': {}, 'processor_data': []},
-        'ZMW': {'internal': [], 'processors': {}, 'processor_data': []},
-        'ZAR': {'internal': [], 'processors': {}, 'processor_data': []}
-    },
-    'payouts': {
-        'UGX': {'internal': [], 'processors': {}, 'processor_data': []},
-        'NGN': {'internal': [], 'processors': {}, 'processor_data': []},
-        'TZS': {'internal': [], 'processors': {}, 'processor_data': []},
-        'KES': {'internal': [], 'processors': {}, 'processor_data': []},
-        'GHS': {'internal': [], 'processors': {}, 'processor_data': []},
-        'ZMW': {'internal': [], 'processors': {}, 'processor_data': []},
-        'ZAR': {'internal': [], 'processors': {}, 'processor_data': []}
-    },
-    'fund_transfers': {
-        'UGX': {'internal': [], 'processors': {}, 'processor_data': []},
-        'NGN': {'internal': [], 'processors': {}, 'processor_data': []},
-        'TZS': {'internal': [], 'processors': {}, 'processor_data': []},
-        'KES': {'internal': [], 'processors': {}, 'processor_data': []},
-        'GHS': {'internal': [], 'processors': {}, 'processor_data': []},
-        'ZMW': {'internal': [], 'processors': {}, 'processor_data': []},
-        'ZAR': {'internal': [], 'processors': {}, 'processor_data': []}
+MODULES = ['collections', 'payouts', 'fund_transfers']
+CURRENCIES = ['UGX', 'NGN', 'TZS', 'KES', 'GHS', 'ZMW', 'ZAR']
+
+# Storage backend for datasets and history: 'memory' (this process only) or 'sqlite' (shared by all workers)
+STORAGE_BACKEND = os.environ.get('RECON_STORAGE_BACKEND', 'memory')
+DATA_DIR = os.environ.get('RECON_DATA_DIR', 'data')
+# Convert upload batches and snapshot dictionaries pickled by earlier versions when SQLite storage opens.
+# Only for a database you trust: this is the one place that unpickles stored data
+MIGRATE_PICKLES = os.environ.get('RECON_MIGRATE_PICKLES', '0') == '1'
+
+# Token expected in the X-Admin-Token header by admin endpoints and profiled requests; unset disables both
+ADMIN_TOKEN = os.environ.get('RECON_ADMIN_TOKEN')
+
+# Finished and running background jobs kept for polling
+JOB_RETENTION = int(os.environ.get('RECON_JOB_RETENTION', 200))
+
+# Columns parsed from uploaded files and their dtypes
+INGEST_COLUMNS = ['reference_number', 'amount', 'description', 'transaction_date']
+INGEST_DTYPES = {'reference_number': str, 'amount': np.float64, 'description': str, 'transaction_date': str}
+
+# Largest Excel date serial (9999-12-31); bigger numbers in a date column are parsed as text
+EXCEL_MAX_SERIAL = 2958465
+
+# Rows parsed per batch when streaming CSV uploads; bounds parser memory regardless of file size
+CSV_CHUNK_ROWS = int(os.environ.get('RECON_CSV_CHUNK_ROWS', 100000))
+
+# Excel reader for .xlsx uploads: 'streaming' (expat scan of the sheet XML, ingest columns only) or 'pandas'
+EXCEL_READERS = ('streaming', 'pandas')
+EXCEL_READER = os.environ.get('RECON_EXCEL_READER', 'streaming')
+XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+XLSX_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+# Parsed Excel uploads kept by content hash and reader so re-uploading a statement skips parsing
+EXCEL_CACHE_SIZE = int(os.environ.get('RECON_EXCEL_CACHE_SIZE', 4))
+excel_cache = OrderedDict()
+
+# Columnar snapshots of parsed uploads on disk, keyed by content hash and memory-mapped when loaded again
+SNAPSHOTS_ENABLED = os.environ.get('RECON_SNAPSHOTS', '0') == '1'
+SNAPSHOT_DIR = os.path.join(DATA_DIR, 'snapshots')
+SNAPSHOT_FORMAT = 2
+SNAPSHOT_TEXT_SEPARATOR = '\x00'
+SNAPSHOT_KEY = re.compile(r'[0-9a-f]{64}')
+# Snapshots beyond the newest SNAPSHOT_RETENTION are deleted unless a stored upload still references them
+SNAPSHOT_RETENTION = int(os.environ.get('RECON_SNAPSHOT_RETENTION', 50))
+
+# Columnar dataset helpers
+def categorical_column(value, length):
+    """Build a single-valued categorical column without materializing per-row strings"""
+    return pd.Categorical.from_codes(np.zeros(length, dtype=np.int8), categories=[value])
+
+def compact_text(column):
+    """Store repetitive text columns (narrations, channels) as categoricals"""
+    if len(column) > 0 and column.nunique() <= len(column) // 2:
+        return column.astype('category')
+    return column
+
+def empty_dataset(processor=False):
+    """Empty dataset with the stored column layout"""
+    columns = {
+        'reference_number': pd.Series([], dtype=object),
+        'amount': pd.Series([], dtype=np.float64),
+        'description': pd.Series([], dtype=object),
+        'amount_minor': pd.Series([], dtype=np.int64),
+        'reference_hash': pd.Series([], dtype=np.uint64),
+        'reference_check': pd.Series([], dtype=np.uint32),
+        'currency': pd.Series([], dtype='category')
+    }
+    if processor:
+        columns['processor_name'] = pd.Series([], dtype='category')
+    return pd.DataFrame(columns)
+
+def empty_slot():
+    """Empty internal and processor datasets for one module/currency"""
+    return {'internal': empty_dataset(), 'processor_data': empty_dataset(processor=True)}
+
+def parse_transaction_dates(values):
+    """Transaction dates as datetime64; numbers in the Excel serial range are read as serial days"""
+    values = pd.Series(values, dtype=object)
+    numbers = np.fromiter(
+        (isinstance(value, (int, float, np.number)) and not isinstance(value, bool) for value in values),
+        dtype=bool, count=len(values)
+    )
+    with warnings.catch_warnings():
+        # Format inference warns when it falls back to per-value parsing
+        warnings.simplefilter('ignore', UserWarning)
+        dates = pd.to_datetime(values.where(~numbers), errors='coerce')
+    
+    # Values the inferred format missed: Excel serials, then any other recognisable date
+    retry = dates.isna() & values.notna()
+    if retry.any():
+        numeric = pd.to_numeric(values[retry], errors='coerce')
+        serial = numeric.between(1, EXCEL_MAX_SERIAL)
+        dates[numeric.index[serial]] = pd.to_datetime(numeric[serial], unit='D', origin='1899-12-30')
+        text = numeric.index[~serial]
+        dates[text] = pd.to_datetime(values[text], errors='coerce', format='mixed')
+    return dates.astype('datetime64[ns]')
+
+def build_dataset(df, currency, processor_name=None):
+    """Convert an uploaded frame into the compact columnar layout used by the store"""
+    df = df.reset_index(drop=True)
+    df['reference_number'] = normalize_references(df['reference_number'])
+    df['reference_hash'], df['reference_check'] = reference_hashes(df['reference_number'].to_numpy(dtype=object))
+    df['amount'], df['amount_minor'], _ = to_minor_units(df['amount'], currency)
+    if 'description' in df.columns:
+        df['description'] = compact_text(df['description'].astype(object).fillna(''))
+    else:
+        df['description'] = categorical_column('', len(df))
+    if 'transaction_date' in df.columns:
+        df['transaction_date'] = parse_transaction_dates(df['transaction_date'])
+    df['currency'] = categorical_column(currency, len(df))
+    if processor_name is not None:
+        df['processor_name'] = categorical_column(processor_name, len(df))
+    return df
+
+def concat_datasets(datasets):
+    """Concatenate stored datasets once, keeping categorical columns categorical"""
+    datasets = [dataset for dataset in datasets if len(dataset) > 0] or datasets[:1]
+    if len(datasets) == 1:
+        return datasets[0]
+    datasets = [dataset.copy(deep=False) for dataset in datasets]
+    for column in datasets[0].columns:
+        if all(column in dataset.columns and isinstance(dataset[column].dtype, pd.CategoricalDtype)
+               for dataset in datasets):
+            categories = pd.Index([])
+            for dataset in datasets:
+                categories = categories.append(dataset[column].cat.categories.difference(categories, sort=False))
+            for dataset in datasets:
+                dataset[column] = dataset[column].cat.set_categories(categories)
+    return pd.concat(datasets, ignore_index=True)
+
+def read_csv_batches(stream):
+    """Parse a CSV stream in CSV_CHUNK_ROWS batches, reading only the ingest columns"""
+    return pd.read_csv(
+        stream,
+        usecols=lambda column: column in INGEST_COLUMNS,
+        dtype=INGEST_DTYPES,
+        chunksize=CSV_CHUNK_ROWS
+    )
+
+def xlsx_first_sheet_path(archive):
+    """Path of the first worksheet inside an .xlsx archive"""
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheet = workbook.find(f'{XLSX_NS}sheets/{XLSX_NS}sheet')
+    relation_id = sheet.get(f'{{{XLSX_REL_NS}}}id')
+    relations = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for relation in relations:
+        if relation.get('Id') == relation_id:
+            target = relation.get('Target')
+            return target.lstrip('/') if target.startswith('/') else f'xl/{target}'
+    return 'xl/worksheets/sheet1.xml'
+
+def xlsx_shared_strings(archive):
+    """Load the shared string table of an .xlsx archive"""
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+    strings = []
+    parts = []
+    state = {'text': False}
+
+    def start(name, attrs):
+        if name == 'si':
+            parts.clear()
+        elif name == 't':
+            state['text'] = True
+
+    def end(name):
+        if name == 't':
+            state['text'] = False
+        elif name == 'si':
+            strings.append(''.join(parts))
+
+    def characters(data):
+        if state['text']:
+            parts.append(data)
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = characters
+    with archive.open('xl/sharedStrings.xml') as stream:
+        parser.ParseFile(stream)
+    return strings
+
+def xlsx_column_index(cell_ref):
+    """Zero-based column index of an A1-style cell reference"""
+    index = 0
+    for char in cell_ref:
+        if char.isdigit():
+            break
+        index = index * 26 + ord(char) - 64
+    return index - 1
+
+def xlsx_cell_value(text, cell_type, shared):
+    """Convert raw cell text to a Python value"""
+    if cell_type == 's':
+        return shared[int(text)]
+    if cell_type in ('str', 'inlineStr', 'e'):
+        return text
+    if cell_type == 'b':
+        return text == '1'
+    if text == '':
+        return None
+    if text.lstrip('-').isdigit():
+        return int(text)
+    return float(text)
+
+def read_excel_batches(content):
+    """Stream the first worksheet of an .xlsx file, converting only the ingest columns.
+
+    The sheet XML is scanned with expat; cells outside the wanted columns are
+    skipped without building elements or converting values.
+    """
+    with zipfile.ZipFile(io.BytesIO(content)) as archive:
+        shared = xlsx_shared_strings(archive)
+        state = {'header': None, 'wanted': None, 'row': {}, 'column': -1,
+                 'cell': None, 'type': None, 'capture': False}
+        text = []
+        rows = []
+        batches = []
+
+        def start(name, attrs):
+            if name == 'c':
+                cell_ref = attrs.get('r')
+                state['column'] = xlsx_column_index(cell_ref) if cell_ref else state['column'] + 1
+                if state['wanted'] is None or state['column'] in state['wanted']:
+                    state['cell'] = state['column']
+                    state['type'] = attrs.get('t')
+                    text.clear()
+            elif name in ('v', 't') and state['cell'] is not None:
+                state['capture'] = True
+            elif name == 'row':
+                state['row'] = {}
+                state['column'] = -1
+
+        def end(name):
+            if name in ('v', 't'):
+                state['capture'] = False
+            elif name == 'c' and state['cell'] is not None:
+                state['row'][state['cell']] = xlsx_cell_value(''.join(text), state['type'], shared)
+                state['cell'] = None
+            elif name == 'row':
+                if state['header'] is None:
+                    state['header'] = {
+                        position: name for position, name in state['row'].items() if name in INGEST_COLUMNS
+                    }
+                    state['wanted'] = set(state['header'])
+                elif any(value is not None for value in state['row'].values()):
+                    rows.append([state['row'].get(position) for position in state['header']])
+                    if len(rows) == CSV_CHUNK_ROWS:
+                        batches.append(excel_batch(rows, list(state['header'].values())))
+                        rows.clear()
+
+        def characters(data):
+            if state['capture']:
+                text.append(data)
+
+        parser = expat.ParserCreate()
+        parser.buffer_text = True
+        parser.StartElementHandler = start
+        parser.EndElementHandler = end
+        parser.CharacterDataHandler = characters
+        with archive.open(xlsx_first_sheet_path(archive)) as stream:
+            parser.ParseFile(stream)
+
+    if rows or not batches:
+        batches.append(excel_batch(rows, list((state['header'] or {}).values())))
+    return batches
+
+def excel_batch(rows, columns):
+    """Build a batch frame from worksheet row values with the ingest dtypes"""
+    batch = pd.DataFrame(rows, columns=columns)
+    for column in ('reference_number', 'description'):
+        if column in batch.columns:
+            batch[column] = batch[column].map(lambda value: value if value is None else str(value))
+    return batch
+
+def read_excel_cached(content, reader):
+    """Parse an Excel upload, reusing the cached batches for identical file content read by the same reader"""
+    key = (hashlib.sha256(content).hexdigest(), reader)
+    if key in excel_cache:
+        excel_cache.move_to_end(key)
+        return excel_cache[key], 'cache'
+
+    if reader == 'streaming':
+        batches = read_excel_batches(content)
+    else:
+        batches = [pd.read_excel(
+            io.BytesIO(content),
+            usecols=lambda column: column in INGEST_COLUMNS,
+            dtype={'reference_number': str, 'description': str}
+        )]
+
+    excel_cache[key] = batches
+    while len(excel_cache) > EXCEL_CACHE_SIZE:
+        excel_cache.popitem(last=False)
+    return batches, reader
+
+def snapshot_key(stream, *options):
+    """Hash of an upload's content and the ingest options that shape its dataset; rewinds the stream"""
+    digest = hashlib.sha256('|'.join(map(str, (SNAPSHOT_FORMAT, *options))).encode())
+    for block in iter(lambda: stream.read(1 << 20), b''):
+        digest.update(block)
+    stream.seek(0)
+    return digest.hexdigest()
+
+def json_scalar(value):
+    """JSON form of numpy scalars in a column dictionary"""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} values cannot be stored')
+
+def encode_column(values):
+    """Stored form of a dataset column as (spec, array, dictionary text); numpy and json read it back without pickle.
+
+    Numeric and datetime columns are stored as is. Text and categorical
+    columns are dictionary-encoded: integer codes in the array and the
+    distinct values joined by SNAPSHOT_TEXT_SEPARATOR, or a JSON list when a
+    value is not text or contains the separator.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        kind, codes, dictionary = 'category', values.cat.codes.to_numpy(), list(values.cat.categories)
+    elif values.dtype == object:
+        codes, uniques = pd.factorize(values.to_numpy())
+        kind, codes, dictionary = 'text', codes.astype(np.int32), list(uniques)
+    else:
+        array = values.to_numpy()
+        if array.dtype.hasobject:
+            raise TypeError(f'Column {values.name} of type {values.dtype} cannot be stored')
+        if array.dtype.metadata is not None:
+            # Frames unpickled from earlier versions carry (empty) datetime dtype metadata numpy warns about
+            array = array.view(np.dtype(array.dtype.str))
+        return {'kind': 'array'}, array, None
+    
+    text = SNAPSHOT_TEXT_SEPARATOR.join(dictionary) if all(isinstance(v, str) for v in dictionary) else None
+    if text is not None and text.count(SNAPSHOT_TEXT_SEPARATOR) == max(len(dictionary) - 1, 0):
+        return {'kind': kind, 'dictionary': 'text', 'size': len(dictionary)}, codes, text
+    return {'kind': kind, 'dictionary': 'json', 'size': len(dictionary)}, codes, json.dumps(dictionary, default=json_scalar)
+
+def decode_column(spec, values, text):
+    """Column values from the stored form encode_column returned"""
+    if spec['kind'] == 'array':
+        return values
+    if spec['dictionary'] == 'json':
+        dictionary = json.loads(text)
+    elif spec['dictionary'] == 'text':
+        dictionary = text.split(SNAPSHOT_TEXT_SEPARATOR) if spec['size'] else []
+    else:
+        raise ValueError(f"Column dictionary stored as {spec['dictionary']}; set RECON_MIGRATE_PICKLES=1 once to convert it")
+    if spec['kind'] == 'category':
+        return pd.Categorical.from_codes(values, categories=dictionary)
+    # Missing values have code -1, which picks the trailing None
+    lookup = np.empty(spec['size'] + 1, dtype=object)
+    lookup[:-1] = dictionary
+    return lookup[values]
+
+def save_snapshot(key, df):
+    """Write a dataset as one .npy file per column and return it loaded back from the snapshot.
+
+    Columns are stored as encode_column returns them, with dictionaries in
+    a .txt or .json file next to the codes.
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=SNAPSHOT_DIR)
+    columns = {}
+    for column in df.columns:
+        spec, values, text = encode_column(df[column])
+        np.save(os.path.join(staging, f'{column}.npy'), values, allow_pickle=False)
+        if text is not None:
+            with open(os.path.join(staging, f"{column}.{spec['dictionary']}"), 'w', encoding='utf-8', newline='') as handle:
+                handle.write(text)
+        columns[column] = spec
+    
+    with open(os.path.join(staging, 'meta.json'), 'w') as handle:
+        json.dump({'format': SNAPSHOT_FORMAT, 'rows': len(df), 'columns': columns}, handle)
+    try:
+        os.rename(staging, os.path.join(SNAPSHOT_DIR, key))
+    except OSError:
+        # Another worker wrote the same snapshot first
+        shutil.rmtree(staging, ignore_errors=True)
+    return load_snapshot(key)
+
+def load_snapshot(key):
+    """Dataset stored under key, or None; column arrays and codes are memory-mapped read-only.
+
+    Text columns are decoded from their dictionary once, so their cost scales
+    with the number of distinct values rather than the file size.
+    """
+    path = os.path.join(SNAPSHOT_DIR, key)
+    try:
+        with open(os.path.join(path, 'meta.json')) as handle:
+            meta = json.load(handle)
+        # Reuse makes the snapshot the newest again for prune_snapshots
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    
+    columns = {}
+    for column, spec in meta['columns'].items():
+        values = np.load(os.path.join(path, f'{column}.npy'), mmap_mode='r', allow_pickle=False)
+        text = None
+        if spec['kind'] != 'array' and spec['dictionary'] in ('text', 'json'):
+            with open(os.path.join(path, f"{column}.{spec['dictionary']}"), encoding='utf-8', newline='') as handle:
+                text = handle.read()
+        columns[column] = decode_column(spec, values, text)
+    df = pd.DataFrame(columns, copy=False)
+    df.attrs['snapshot'] = key
+    return df
+
+def migrate_snapshot(key):
+    """Rewrite the pickled column dictionaries of a snapshot from an earlier version as JSON"""
+    path = os.path.join(SNAPSHOT_DIR, key)
+    try:
+        with open(os.path.join(path, 'meta.json')) as handle:
+            meta = json.load(handle)
+    except FileNotFoundError:
+        return
+    for column, spec in meta['columns'].items():
+        if spec.get('dictionary') == 'pickle':
+            with open(os.path.join(path, f'{column}.pkl'), 'rb') as handle:
+                dictionary = pickle.load(handle)
+            with open(os.path.join(path, f'{column}.json'), 'w', encoding='utf-8') as handle:
+                json.dump(dictionary, handle, default=json_scalar)
+            spec['dictionary'] = 'json'
+            os.remove(os.path.join(path, f'{column}.pkl'))
+    with open(os.path.join(path, 'meta.json.tmp'), 'w') as handle:
+        json.dump(meta, handle)
+    os.replace(os.path.join(path, 'meta.json.tmp'), os.path.join(path, 'meta.json'))
+
+def dataset_blob(df):
+    """A dataset as .npz bytes: encode_column arrays and dictionaries plus JSON metadata, none of it pickled"""
+    arrays, columns = {}, []
+    for position, column in enumerate(df.columns):
+        spec, arrays[f'column_{position}'], text = encode_column(df[column])
+        if text is not None:
+            arrays[f'dictionary_{position}'] = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+        columns.append(dict(spec, name=column))
+    meta = json.dumps({'format': SNAPSHOT_FORMAT, 'rows': len(df), 'columns': columns})
+    arrays['meta'] = np.frombuffer(meta.encode('utf-8'), dtype=np.uint8)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def load_dataset_blob(data):
+    """Dataset from dataset_blob bytes; object arrays are refused rather than unpickled"""
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        meta = json.loads(arrays['meta'].tobytes().decode('utf-8'))
+        columns = {}
+        for position, spec in enumerate(meta['columns']):
+            text = arrays[f'dictionary_{position}'].tobytes().decode('utf-8') if f'dictionary_{position}' in arrays else None
+            columns[spec['name']] = decode_column(spec, arrays[f'column_{position}'], text)
+    return pd.DataFrame(columns, index=pd.RangeIndex(meta['rows']), copy=False)
+
+def snapshot_mtime(key):
+    try:
+        return os.path.getmtime(os.path.join(SNAPSHOT_DIR, key))
+    except FileNotFoundError:
+        return 0.0
+
+def prune_snapshots(referenced):
+    """Delete snapshots beyond the newest SNAPSHOT_RETENTION (by last write or reuse) that are not in referenced.
+
+    Returns the deleted keys. Frames already mapped from a deleted snapshot
+    stay readable until they are dropped.
+    """
+    try:
+        keys = [name for name in os.listdir(SNAPSHOT_DIR) if SNAPSHOT_KEY.fullmatch(name)]
+    except FileNotFoundError:
+        return []
+    keys.sort(key=snapshot_mtime, reverse=True)
+    removed = [key for key in keys[SNAPSHOT_RETENTION:] if key not in referenced]
+    for key in removed:
+        shutil.rmtree(os.path.join(SNAPSHOT_DIR, key), ignore_errors=True)
+    return removed
+
+# Streaming .xlsx writer for the full report: rows go straight into the zip stream as inline strings
+XLSX_MAX_ROWS = 1048576
+EXCEL_SPOOL_BYTES = int(os.environ.get('RECON_EXCEL_SPOOL_BYTES', 64 * 1024 * 1024))
+XLSX_ILLEGAL_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+XLSX_SHEET_NAME_CHARS = re.compile(r'[\[\]:*?/\\]')
+XLSX_EMPTY_CELL = '<c/>'
+
+def xlsx_cell(value):
+    """Cell XML for one Python value; numbers as numeric cells, everything else as inline text"""
+    if value is None or value is pd.NA or value is pd.NaT:
+        return XLSX_EMPTY_CELL
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, np.integer, np.floating)):
+        if value != value:
+            return XLSX_EMPTY_CELL
+        if np.isfinite(value):
+            return f'<c><v>{value!r}</v></c>'
+    text = escape(XLSX_ILLEGAL_CHARS.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def xlsx_text_cells(texts):
+    """Inline-string cells for a list of str, cleaned and escaped in one pass over the joined column"""
+    joined = '\n'.join(texts)
+    if not texts or joined.count('\n') != len(texts) - 1:
+        # Values with embedded newlines cannot be split back apart
+        return [xlsx_cell(text) for text in texts]
+    joined = escape(XLSX_ILLEGAL_CHARS.sub('', joined))
+    return [f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>' for text in joined.split('\n')]
+
+def xlsx_cells(values):
+    """Cell XML for a column, using a vectorized path for plain numeric, text and categorical columns"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        rendered = xlsx_cells(pd.Series(values.cat.categories)) + [XLSX_EMPTY_CELL]
+        return np.array(rendered, dtype=object)[values.cat.codes.to_numpy()].tolist()
+    
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind == 'M':
+        present = values.dropna()
+        date_only = bool((present == present.dt.normalize()).all())
+        return xlsx_cells(values.dt.strftime('%Y-%m-%d' if date_only else '%Y-%m-%d %H:%M:%S'))
+    
+    array = values.to_numpy()
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'iu':
+        return [f'<c><v>{value}</v></c>' for value in array.tolist()]
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind == 'f':
+        cells = [f'<c><v>{value!r}</v></c>' for value in array.tolist()]
+        for position in np.flatnonzero(~np.isfinite(array)):
+            cells[position] = xlsx_cell(array[position])
+        return cells
+    
+    cells = np.full(len(array), XLSX_EMPTY_CELL, dtype=object)
+    present = np.flatnonzero(~pd.isna(values).to_numpy())
+    items = array[present].tolist()
+    if all(type(item) is str for item in items):
+        cells[present] = xlsx_text_cells(items)
+    else:
+        cells[present] = [xlsx_cell(item) for item in items]
+    return cells.tolist()
+
+class XlsxStreamWriter:
+    """Write-only workbook streamed into a file object; memory use is bounded by one chunk of rows"""
+
+    def __init__(self, fileobj):
+        self.archive = zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED, compresslevel=1)
+        self.sheets = []
+
+    def sheet_name(self, name):
+        """Valid, unique Excel sheet name (31 characters, no []:*?/\\)"""
+        base = XLSX_SHEET_NAME_CHARS.sub('_', str(name))[:31] or 'Sheet'
+        taken = {sheet.lower() for sheet in self.sheets}
+        candidate, number = base, 1
+        while candidate.lower() in taken:
+            number += 1
+            suffix = f' ({number})'
+            candidate = base[:31 - len(suffix)] + suffix
+        return candidate
+
+    def add_frame(self, name, df):
+        """Write a DataFrame with a bold header row, continuing on extra sheets past Excel's row limit"""
+        header = '<row>' + ''.join(
+            xlsx_cell(column).replace('<c ', '<c s="1" ', 1) for column in df.columns
+        ) + '</row>'
+        per_sheet = XLSX_MAX_ROWS - 1
+        for sheet_start in range(0, max(len(df), 1), per_sheet):
+            self.sheets.append(self.sheet_name(name))
+            path = f'xl/worksheets/sheet{len(self.sheets)}.xml'
+            with self.archive.open(path, 'w', force_zip64=True) as part:
+                part.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                           f'<worksheet xmlns="{XLSX_NS[1:-1]}"><sheetData>{header}'.encode('utf-8'))
+                sheet_stop = min(sheet_start + per_sheet, len(df))
+                for start in range(sheet_start, sheet_stop, REPORT_CHUNK_ROWS):
+                    chunk = df.iloc[start:min(start + REPORT_CHUNK_ROWS, sheet_stop)]
+                    columns = [xlsx_cells(chunk[column]) for column in chunk.columns]
+                    part.write(''.join('<row>' + ''.join(cells) + '</row>' for cells in zip(*columns)).encode('utf-8'))
+                part.write(b'</sheetData></worksheet>')
+
+    def close(self):
+        """Write the workbook parts that list the sheets and finish the zip"""
+        sheets = ''.join(
+            f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{number}" r:id="rId{number}"/>'
+            for number, name in enumerate(self.sheets, 1)
+        )
+        relationships = ''.join(
+            f'<Relationship Id="rId{number}" Type="{XLSX_REL_NS}/worksheet" Target="worksheets/sheet{number}.xml"/>'
+            for number in range(1, len(self.sheets) + 1)
+        )
+        overrides = ''.join(
+            f'<Override PartName="/xl/worksheets/sheet{number}.xml" '
+            f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for number in range(1, len(self.sheets) + 1)
+        )
+        styles_id = len(self.sheets) + 1
+        self.archive.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f'{overrides}</Types>'
+        ))
+        self.archive.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'<Relationship Id="rId1" Type="{XLSX_REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        self.archive.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<workbook xmlns="{XLSX_NS[1:-1]}" xmlns:r="{XLSX_REL_NS}"><sheets>{sheets}</sheets></workbook>'
+        ))
+        self.archive.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{relationships}<Relationship Id="rId{styles_id}" Type="{XLSX_REL_NS}/styles" Target="styles.xml"/>'
+            '</Relationships>'
+        ))
+        self.archive.writestr('xl/styles.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<styleSheet xmlns="{XLSX_NS[1:-1]}">'
+            '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+            '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+            '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+            '<fill><patternFill patternType="gray125"/></fill></fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+            '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            '</styleSheet>'
+        ))
+        self.archive.close()
+
+def processor_groups(processor_df):
+    """Row positions of each processor's records, in upload order"""
+    codes = processor_df['processor_name'].cat.codes.to_numpy()
+    return {
+        name: np.flatnonzero(codes == code)
+        for code, name in enumerate(processor_df['processor_name'].cat.categories)
     }
+
+# Reconciliation history: only the newest HISTORY_RETENTION entries are kept, running totals cover all runs
+HISTORY_RETENTION = int(os.environ.get('RECON_HISTORY_RETENTION', 10000))
+
+# Running totals kept next to the history: overall statistic -> history entry field
+STATISTICS_FIELDS = {
+    'total_matched': 'matched_count',
+    'total_unmatched_internal': 'unmatched_internal_count',
+    'total_unmatched_processor': 'unmatched_processor_count'
 }
 
-# Store reconciliation history
-reconciliation_history = []
+def empty_statistics():
+    return {'total_reconciliations': 0, **{total: 0 for total in STATISTICS_FIELDS}}
+
+def add_statistics(totals, entry):
+    """Add one history entry to running totals in place"""
+    totals['total_reconciliations'] += 1
+    for total, field in STATISTICS_FIELDS.items():
+        totals[total] += entry.get(field, 0)
+
+# Matching engine used by /reconcile unless the request picks one
+# ('vectorized', 'partitioned', 'one_to_one' or 'legacy')
+MATCH_ENGINE = os.environ.get('RECON_MATCH_ENGINE', 'vectorized')
+
+# Amounts are stored and compared as int64 minor units of their currency, converted once at ingest.
+# Both settings can be overridden per currency, e.g. RECON_CURRENCY_DECIMALS='UGX:0,KES:2'.
+def currency_settings(variable, defaults):
+    """Per-currency integer settings from an environment variable, over the defaults"""
+    settings = dict(defaults)
+    for item in os.environ.get(variable, '').split(','):
+        if item.strip():
+            currency, value = item.split(':')
+            settings[currency.strip().upper()] = int(value)
+    return settings
+
+CURRENCY_DECIMALS = currency_settings('RECON_CURRENCY_DECIMALS', {
+    'UGX': 0, 'NGN': 2, 'TZS': 0, 'KES': 2, 'GHS': 2, 'ZMW': 2, 'ZAR': 2
+})
+# Largest difference, in minor units, still counted as a match (inclusive); 0 means equal after rounding
+AMOUNT_TOLERANCE = currency_settings('RECON_AMOUNT_TOLERANCE', {currency: 0 for currency in CURRENCIES})
+
+# Columns of the matches table produced by every engine
+MATCH_COLUMNS = ['reference', 'internal_amount', 'processor_amount', 'processor', 'match_type', 'currency']
 
 # Helper function to format numbers with commas
 def format_currency(amount):
@@ -89,27 +759,2179 @@ def find_matches_optimized(internal_data, processor_data):
     
     return matches, matched_references
 
+# Columnar helpers for the vectorized matching engine
+def frame_to_records(df):
+    """Convert a DataFrame to a list of dicts with native Python values"""
+    columns = list(df.columns)
+    values = [df[column].tolist() for column in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+def normalize_references(values):
+    """Normalize reference numbers to stripped string keys; missing references become ''"""
+    values = pd.Series(values)
+    keys = np.array([str(value).strip() for value in values], dtype=object)
+    keys[values.isna().to_numpy()] = ''
+    return keys
+
+# Second SipHash key for reference_check, independent of pandas' default key used for reference_hash
+REFERENCE_CHECK_KEY = 'recon-ref-check!'
+
+def reference_hashes(references):
+    """Two independent hashes of each reference key: a 64-bit one to join on and a 32-bit one to catch its collisions.
+
+    The check only has to tell apart the rare references that share a join
+    hash, so its low 32 bits are enough and save 4 bytes per stored row.
+    """
+    return (pd.util.hash_array(references, categorize=False),
+            pd.util.hash_array(references, hash_key=REFERENCE_CHECK_KEY, categorize=False).astype(np.uint32))
+
+def dataset_reference_hashes(df):
+    """(reference_hash, reference_check) of a stored dataset"""
+    if 'reference_hash' in df.columns and df['reference_hash'].dtype == np.uint64 \
+            and 'reference_check' in df.columns and df['reference_check'].dtype in (np.uint32, np.uint64):
+        # Datasets stored with a 64-bit check truncate to the same low 32 bits
+        return df['reference_hash'].to_numpy(), df['reference_check'].to_numpy().astype(np.uint32, copy=False)
+    # Datasets stored before reference hashes were kept at ingest
+    return reference_hashes(df['reference_number'].to_numpy(dtype=object))
+
+def first_code_rows(codes):
+    """Position of each code's first row, indexed by code, for codes numbered in order of first appearance"""
+    # A new running maximum marks a code's first row
+    return np.flatnonzero(np.diff(np.maximum.accumulate(codes), prepend=-1) > 0)
+
+def reference_codes(internal_df, processor_df):
+    """Integer join keys for both datasets' references; equal codes mean equal references.
+
+    Factorizing the uint64 hashes kept at ingest is several times cheaper
+    than hashing millions of strings again. Every row's check hash must
+    equal that of the first row with its code; if any differs, two
+    references share a join hash and the strings are factorized instead.
+    """
+    internal_hash, internal_check = dataset_reference_hashes(internal_df)
+    processor_hash, processor_check = dataset_reference_hashes(processor_df)
+    codes, _ = pd.factorize(np.concatenate([internal_hash, processor_hash]))
+    check = np.concatenate([internal_check, processor_check])
+    if not np.array_equal(check, check[first_code_rows(codes)][codes]):
+        codes, _ = pd.factorize(np.concatenate([
+            internal_df['reference_number'].to_numpy(dtype=object), processor_df['reference_number'].to_numpy(dtype=object)
+        ]))
+    return codes[:len(internal_df)], codes[len(internal_df):]
+
+def to_minor_units(values, currency):
+    """Convert amounts to int64 minor units of the currency; returns (amounts, minor, valid_mask)"""
+    amounts = pd.to_numeric(pd.Series(values), errors='coerce').to_numpy(dtype=np.float64)
+    valid = np.isfinite(amounts)
+    minor = np.zeros(len(amounts), dtype=np.int64)
+    minor[valid] = np.rint(amounts[valid] * 10 ** CURRENCY_DECIMALS.get(currency, 2)).astype(np.int64)
+    return amounts, minor, valid
+
+def dataset_currency(df):
+    """Currency of a stored dataset (every row of a slot shares one), or None when empty"""
+    categories = df['currency'].cat.categories if isinstance(df['currency'].dtype, pd.CategoricalDtype) \
+        else pd.unique(df['currency'])
+    return categories[0] if len(categories) else None
+
+def dataset_amounts(df, rows=None):
+    """(amounts, minor units, valid mask) of a stored dataset, optionally for some row positions only"""
+    amounts = df['amount'].to_numpy(dtype=np.float64)
+    if 'amount_minor' in df.columns:
+        minor = df['amount_minor'].to_numpy()
+    else:
+        # Datasets stored before minor units were kept at ingest
+        minor = to_minor_units(amounts, dataset_currency(df))[1]
+    if rows is not None:
+        amounts, minor = amounts[rows], minor[rows]
+    return amounts, minor, np.isfinite(amounts)
+
+def amount_tolerance(df):
+    """Matching tolerance in minor units for a stored dataset's currency"""
+    return AMOUNT_TOLERANCE.get(dataset_currency(df), 0)
+
+def join_columns(internal_keys, internal_amounts, internal_valid,
+                 processor_keys, processor_amounts, processor_valid, tolerance=0):
+    """Unordered reference join behind match_columns.
+
+    Returns (internal_rows, processor_rows, first_rows, internal_matched,
+    processor_matched); first_rows holds the position of each pair's
+    reference's first internal row, which match_columns sorts by.
+    """
+    n_internal = len(internal_keys)
+    codes, uniques = pd.factorize(np.concatenate([internal_keys, processor_keys]))
+    internal_codes = codes[:n_internal]
+    processor_codes = codes[n_internal:]
+
+    # Internal row that survives the dict overwrite, and first position of each reference
+    positions = np.arange(n_internal, dtype=np.int64)
+    winner = np.full(len(uniques), -1, dtype=np.int64)
+    np.maximum.at(winner, internal_codes, positions)
+    first_seen = np.full(len(uniques), n_internal, dtype=np.int64)
+    np.minimum.at(first_seen, internal_codes, positions)
+
+    # Candidate internal row for every processor row, then the tolerance check
+    candidates = winner[processor_codes]
+    processor_rows = np.flatnonzero((candidates >= 0) & processor_valid)
+    internal_rows = candidates[processor_rows]
+    within = internal_valid[internal_rows] & (
+        np.abs(processor_amounts[processor_rows] - internal_amounts[internal_rows]) <= tolerance
+    )
+    processor_rows = processor_rows[within]
+    internal_rows = internal_rows[within]
+
+    # Keep the first qualifying processor row per internal row
+    first_hit = np.full(n_internal, len(processor_keys), dtype=np.int64)
+    np.minimum.at(first_hit, internal_rows, processor_rows)
+    internal_rows = np.flatnonzero(first_hit < len(processor_keys))
+    processor_rows = first_hit[internal_rows]
+
+    matched_keys = np.zeros(len(uniques), dtype=bool)
+    matched_keys[internal_codes[internal_rows]] = True
+    internal_matched = matched_keys[internal_codes]
+    processor_matched = matched_keys[processor_codes]
+
+    return internal_rows, processor_rows, first_seen[internal_codes[internal_rows]], internal_matched, processor_matched
+
+def match_columns(internal_keys, internal_amounts, internal_valid,
+                  processor_keys, processor_amounts, processor_valid, tolerance=0):
+    """Join internal and processor columns on reference key.
+
+    Mirrors find_matches_optimized: the last internal row per reference wins,
+    it matches the first processor row within tolerance, and pairs come back
+    in order of each reference's first appearance in the internal data.
+    Returns (internal_rows, processor_rows) as positional index arrays, plus
+    boolean masks aligned with each side's rows marking every row whose
+    reference took part in a match.
+    """
+    internal_rows, processor_rows, first_rows, internal_matched, processor_matched = join_columns(
+        internal_keys, internal_amounts, internal_valid,
+        processor_keys, processor_amounts, processor_valid, tolerance
+    )
+    order = np.argsort(first_rows, kind='stable')
+    return internal_rows[order], processor_rows[order], internal_matched, processor_matched
+
+def match_columns_one_to_one(internal_keys, internal_amounts, internal_valid,
+                             processor_keys, processor_amounts, processor_valid, tolerance=0):
+    """One-to-one join: every row takes part in at most one pair.
+
+    Within a reference, equal amounts pair first, k-th occurrence with k-th
+    occurrence. Leftover rows then pair by amount closeness within tolerance,
+    walking both sides in amount order, which pairs as many leftovers as
+    possible. Exact pairs take precedence, so the total can be lower than
+    a tolerance-only matching would reach. Pairs come back in order of each
+    reference's first appearance in the internal data, then internal row.
+    Returns the same (internal_rows, processor_rows, internal_matched,
+    processor_matched) as match_columns, with row-level masks.
+    """
+    n_internal = len(internal_keys)
+    codes, uniques = pd.factorize(np.concatenate([internal_keys, processor_keys]))
+    internal_codes = codes[:n_internal]
+    processor_codes = codes[n_internal:]
+
+    # Exact pass: pair occurrences of the same (reference, amount) by rank
+    sides = []
+    for side_codes, amounts, valid in ((internal_codes, internal_amounts, internal_valid),
+                                       (processor_codes, processor_amounts, processor_valid)):
+        rows = np.flatnonzero(valid)
+        side = pd.DataFrame({'code': side_codes[rows], 'amount': amounts[rows], 'row': rows})
+        side['rank'] = side.groupby(['code', 'amount'], sort=False).cumcount()
+        sides.append(side)
+    exact = sides[0].merge(sides[1], on=['code', 'amount', 'rank'], suffixes=('_internal', '_processor'))
+    internal_paired = np.zeros(n_internal, dtype=bool)
+    internal_paired[exact['row_internal'].to_numpy()] = True
+    processor_paired = np.zeros(len(processor_keys), dtype=bool)
+    processor_paired[exact['row_processor'].to_numpy()] = True
+
+    # Tolerance pass over the leftovers of references present on both sides, sorted by (reference, amount)
+    leftover_internal = np.flatnonzero(internal_valid & ~internal_paired)
+    leftover_processor = np.flatnonzero(processor_valid & ~processor_paired)
+    internal_left = np.zeros(len(uniques), dtype=bool)
+    internal_left[internal_codes[leftover_internal]] = True
+    processor_left = np.zeros(len(uniques), dtype=bool)
+    processor_left[processor_codes[leftover_processor]] = True
+    shared = internal_left & processor_left
+    leftover_internal = leftover_internal[shared[internal_codes[leftover_internal]]]
+    leftover_processor = leftover_processor[shared[processor_codes[leftover_processor]]]
+    leftover_internal = leftover_internal[np.lexsort((
+        leftover_internal, internal_amounts[leftover_internal], internal_codes[leftover_internal]
+    ))]
+    leftover_processor = leftover_processor[np.lexsort((
+        leftover_processor, processor_amounts[leftover_processor], processor_codes[leftover_processor]
+    ))]
+
+    left_codes = internal_codes[leftover_internal].tolist()
+    left_amounts = internal_amounts[leftover_internal].tolist()
+    right_codes = processor_codes[leftover_processor].tolist()
+    right_amounts = processor_amounts[leftover_processor].tolist()
+    close_internal, close_processor = [], []
+    i = j = 0
+    while i < len(left_codes) and j < len(right_codes):
+        if left_codes[i] != right_codes[j]:
+            if left_codes[i] < right_codes[j]:
+                i += 1
+            else:
+                j += 1
+            continue
+        difference = left_amounts[i] - right_amounts[j]
+        if abs(difference) <= tolerance:
+            close_internal.append(i)
+            close_processor.append(j)
+            i += 1
+            j += 1
+        elif difference < 0:
+            i += 1
+        else:
+            j += 1
+
+    internal_rows = np.concatenate([
+        exact['row_internal'].to_numpy(), leftover_internal[np.array(close_internal, dtype=np.int64)]
+    ])
+    processor_rows = np.concatenate([
+        exact['row_processor'].to_numpy(), leftover_processor[np.array(close_processor, dtype=np.int64)]
+    ])
+    internal_matched = np.zeros(n_internal, dtype=bool)
+    internal_matched[internal_rows] = True
+    processor_matched = np.zeros(len(processor_keys), dtype=bool)
+    processor_matched[processor_rows] = True
+
+    positions = np.arange(n_internal, dtype=np.int64)
+    first_seen = np.full(len(uniques), n_internal, dtype=np.int64)
+    np.minimum.at(first_seen, internal_codes, positions)
+    order = np.lexsort((internal_rows, first_seen[internal_codes[internal_rows]]))
+    return internal_rows[order], processor_rows[order], internal_matched, processor_matched
+
+# Worker processes for partitioned matching. One long-lived pool per server process, started on
+# first use from a forkserver (spawn where there is none), so workers never inherit locks held by
+# this process's threads; inputs are shared through a memory-mapped file written once per call
+PARTITION_WORKERS = int(os.environ.get('RECON_PARTITION_WORKERS', os.cpu_count() or 1))
+# Directory for the mapped column files; a tmpfs such as /dev/shm keeps them off disk if it has room
+PARTITION_DIR = os.environ.get('RECON_PARTITION_DIR', tempfile.gettempdir())
+process_pool = None
+process_pool_lock = threading.Lock()
+in_pool_worker = False
+
+def mark_pool_worker():
+    """Pool initializer: work submitted from inside a worker runs serially instead of nesting pools"""
+    global in_pool_worker
+    in_pool_worker = True
+
+def get_process_pool():
+    """The shared worker pool, created on first use; None inside pool workers"""
+    global process_pool
+    if in_pool_worker:
+        return None
+    with process_pool_lock:
+        if process_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            process_pool = ProcessPoolExecutor(
+                max_workers=PARTITION_WORKERS, mp_context=context, initializer=mark_pool_worker
+            )
+        return process_pool
+
+def write_mapped_columns(columns):
+    """Write arrays back to back to a new file under PARTITION_DIR; returns (path, {name: (dtype, offset, length)})"""
+    handle = tempfile.NamedTemporaryFile(prefix='recon-columns-', suffix='.bin', dir=PARTITION_DIR, delete=False)
+    layout = {}
+    try:
+        with handle:
+            for name, column in columns.items():
+                column = np.ascontiguousarray(column)
+                layout[name] = (column.dtype.str, handle.tell(), len(column))
+                column.tofile(handle)
+    except BaseException:
+        os.remove(handle.name)
+        raise
+    return handle.name, layout
+
+def read_mapped_columns(path, layout):
+    """Read-only views of the arrays written by write_mapped_columns"""
+    return {
+        name: np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=(length,)) if length
+        else np.empty(0, dtype=dtype)
+        for name, (dtype, offset, length) in layout.items()
+    }
+
+# Hash-partitioned matching: every row of a reference lands in the same partition, so partitions
+# match independently on the worker pool
+def join_partition(path, layout, partition, tolerance):
+    """join_columns over one partition of mapped columns, with global row positions; runs in pool workers"""
+    columns = read_mapped_columns(path, layout)
+    internal_idx = np.flatnonzero(columns['internal_partition'] == partition)
+    processor_idx = np.flatnonzero(columns['processor_partition'] == partition)
+    rows, processor_rows, first_rows, internal_hits, processor_hits = join_columns(
+        columns['internal_keys'][internal_idx], columns['internal_amounts'][internal_idx],
+        columns['internal_valid'][internal_idx], columns['processor_keys'][processor_idx],
+        columns['processor_amounts'][processor_idx], columns['processor_valid'][processor_idx], tolerance
+    )
+    return (internal_idx[rows], processor_idx[processor_rows], internal_idx[first_rows],
+            internal_idx[internal_hits], processor_idx[processor_hits])
+
+def match_columns_partitioned(internal_keys, internal_amounts, internal_valid,
+                              processor_keys, processor_amounts, processor_valid, tolerance=0, workers=None,
+                              internal_hash=None, processor_hash=None):
+    """match_columns split by reference hash across worker processes; the output is identical.
+
+    Partitions follow internal_hash/processor_hash, the reference hashes
+    kept at ingest, or the integer keys themselves when none are given.
+    Each call writes its columns to its own mapped file once; every worker
+    maps it, selects its partition, joins it and returns global positions,
+    so only the matched rows travel back.
+    """
+    workers = workers or PARTITION_WORKERS
+    pool = get_process_pool() if workers > 1 and len(internal_keys) else None
+    if pool is None:
+        return match_columns(internal_keys, internal_amounts, internal_valid,
+                             processor_keys, processor_amounts, processor_valid, tolerance)
+    
+    if internal_keys.dtype == object or processor_keys.dtype == object:
+        # Only integer columns can be mapped; equal codes mean equal keys
+        codes, _ = pd.factorize(np.concatenate([internal_keys, processor_keys]))
+        internal_keys, processor_keys = codes[:len(internal_keys)], codes[len(internal_keys):]
+    if internal_hash is None or processor_hash is None:
+        internal_hash, processor_hash = internal_keys, processor_keys
+    partition_type = np.min_scalar_type(workers - 1)
+    path, layout = write_mapped_columns({
+        'internal_keys': internal_keys,
+        'internal_amounts': internal_amounts,
+        'internal_valid': internal_valid,
+        'internal_partition': (internal_hash % workers).astype(partition_type),
+        'processor_keys': processor_keys,
+        'processor_amounts': processor_amounts,
+        'processor_valid': processor_valid,
+        'processor_partition': (processor_hash % workers).astype(partition_type)
+    })
+    try:
+        parts = list(pool.map(join_partition, [path] * workers, [layout] * workers, range(workers), [tolerance] * workers))
+    finally:
+        os.remove(path)
+    
+    # Merge back into serial order: by the first internal position of each pair's reference
+    internal_rows, processor_rows, first_rows, internal_hits, processor_hits = (
+        np.concatenate([part[field] for part in parts]) for field in range(5)
+    )
+    order = np.argsort(first_rows, kind='stable')
+    internal_matched = np.zeros(len(internal_keys), dtype=bool)
+    internal_matched[internal_hits] = True
+    processor_matched = np.zeros(len(processor_keys), dtype=bool)
+    processor_matched[processor_hits] = True
+    return internal_rows[order], processor_rows[order], internal_matched, processor_matched
+
+def match_frames(internal_df, processor_df, matcher=match_columns):
+    """Match two stored datasets column-wise; returns (matches DataFrame, internal mask, processor mask).
+
+    The matcher joins on integer reference codes rather than the strings.
+    """
+    internal_keys = internal_df['reference_number'].to_numpy(dtype=object)
+    processor_keys = processor_df['reference_number'].to_numpy(dtype=object)
+    internal_codes, processor_codes = reference_codes(internal_df, processor_df)
+    internal_values, internal_amounts, internal_valid = dataset_amounts(internal_df)
+    processor_values, processor_amounts, processor_valid = dataset_amounts(processor_df)
+    # Blank references are no join key: those rows stay unmatched and go on to the leftover passes
+    internal_valid &= internal_keys != ''
+    processor_valid &= processor_keys != ''
+
+    internal_rows, processor_rows, internal_matched, processor_matched = matcher(
+        internal_codes, internal_amounts, internal_valid,
+        processor_codes, processor_amounts, processor_valid, amount_tolerance(internal_df)
+    )
+
+    matches_df = pd.DataFrame({
+        'reference': internal_keys[internal_rows],
+        'internal_amount': internal_values[internal_rows],
+        'processor_amount': processor_values[processor_rows],
+        'processor': processor_df['processor_name'].to_numpy(dtype=object)[processor_rows],
+        'match_type': np.where(
+            internal_amounts[internal_rows] == processor_amounts[processor_rows], 'exact', 'within_tolerance'
+        ),
+        'currency': internal_df['currency'].to_numpy(dtype=object)[internal_rows]
+    }, columns=MATCH_COLUMNS)
+    return matches_df, internal_matched, processor_matched
+
+def match_frames_partitioned(internal_df, processor_df):
+    """Vectorized matching spread over RECON_PARTITION_WORKERS processes by the stored reference hash"""
+    hashes = {}
+    if 'reference_hash' in internal_df.columns and 'reference_hash' in processor_df.columns:
+        hashes = {'internal_hash': internal_df['reference_hash'].to_numpy(),
+                  'processor_hash': processor_df['reference_hash'].to_numpy()}
+    return match_frames(internal_df, processor_df, matcher=functools.partial(match_columns_partitioned, **hashes))
+
+def match_frames_one_to_one(internal_df, processor_df):
+    """Multiplicity-aware matching: duplicate references pair row by row instead of collapsing"""
+    return match_frames(internal_df, processor_df, matcher=match_columns_one_to_one)
+
+def match_frames_legacy(internal_df, processor_df):
+    """Run find_matches_optimized over stored datasets; matched masks come from the matched references.
+
+    Rows with a blank reference are left out, as in the columnar engines,
+    and so are the stored-only columns, which the row-by-row loop never reads.
+    """
+    matches, _ = find_matches_optimized(
+        frame_to_records(internal_df[internal_df['reference_number'] != ''].drop(columns=INTERNAL_COLUMNS, errors='ignore')),
+        frame_to_records(processor_df[processor_df['reference_number'] != ''].drop(columns=INTERNAL_COLUMNS, errors='ignore'))
+    )
+    matches_df = pd.DataFrame(matches, columns=MATCH_COLUMNS)
+    matched_references = matches_df['reference'].to_numpy(dtype=object)
+    internal_matched = internal_df['reference_number'].isin(matched_references).to_numpy()
+    processor_matched = processor_df['reference_number'].isin(matched_references).to_numpy()
+    return matches_df, internal_matched, processor_matched
+
+# Available matching engines, selectable per request or via RECON_MATCH_ENGINE
+MATCH_ENGINES = {
+    'legacy': match_frames_legacy,
+    'vectorized': match_frames,
+    'partitioned': match_frames_partitioned,
+    'one_to_one': match_frames_one_to_one
+}
+
+# Leftover passes: extra matchers run, in order, over the rows the engine left unmatched
+# (full reconciliations only; incremental runs match exact references)
+LEFTOVER_PASSES = [name for name in os.environ.get('RECON_LEFTOVER_PASSES', '').split(',') if name]
+LEFTOVER_MATCH_COLUMNS = [
+    'internal_reference', 'processor_reference', 'internal_amount', 'processor_amount',
+    'processor', 'match_type', 'similarity', 'currency'
+]
+EMPTY_LEFTOVER_MATCHES = pd.DataFrame(columns=LEFTOVER_MATCH_COLUMNS)
+
+# Reference normalization for the fuzzy pass, applied in the listed order
+REFERENCE_RULES = [rule for rule in os.environ.get(
+    'RECON_REFERENCE_RULES', 'casefold,alphanumeric,strip_prefixes,strip_leading_zeros'
+).split(',') if rule]
+REFERENCE_PREFIXES = [prefix.casefold() for prefix in os.environ.get(
+    'RECON_REFERENCE_PREFIXES', 'txn,trx,ref,ft'
+).split(',') if prefix]
+FUZZY_MIN_SIMILARITY = float(os.environ.get('RECON_FUZZY_MIN_SIMILARITY', 0.8))
+FUZZY_MAX_POSTINGS = int(os.environ.get('RECON_FUZZY_MAX_POSTINGS', 200))
+NON_ALPHANUMERIC = re.compile(r'[\W_]+')
+
+def strip_reference_prefix(key):
+    """Drop the first configured prefix the key starts with"""
+    for prefix in REFERENCE_PREFIXES:
+        if key.startswith(prefix):
+            return key[len(prefix):]
+    return key
+
+REFERENCE_RULE_FUNCTIONS = {
+    'casefold': str.casefold,
+    'alphanumeric': lambda key: NON_ALPHANUMERIC.sub('', key),
+    'strip_prefixes': strip_reference_prefix,
+    'strip_leading_zeros': lambda key: key.lstrip('0')
+}
+
+def normalize_reference_keys(keys):
+    """Apply REFERENCE_RULES to reference keys"""
+    keys = list(keys)
+    for rule in REFERENCE_RULES:
+        function = REFERENCE_RULE_FUNCTIONS[rule]
+        keys = [function(key) for key in keys]
+    return np.array(keys, dtype=object)
+
+def reference_trigrams(keys, buckets):
+    """Long table of (gram, amount bucket, row) for each distinct trigram of each key"""
+    grams, rows = [], []
+    for row, key in enumerate(keys):
+        key_grams = {key[start:start + 3] for start in range(max(len(key) - 2, 1))}
+        grams.extend(key_grams)
+        rows.extend([row] * len(key_grams))
+    rows = np.array(rows, dtype=np.int64)
+    return pd.DataFrame({'gram': grams, 'bucket': buckets[rows], 'row': rows})
+
+def fuzzy_reference_pass(internal_df, processor_df, internal_left, processor_left):
+    """Match leftovers on normalized references, then on trigram similarity.
+
+    Stage one joins normalized keys one-to-one within amount tolerance.
+    Stage two indexes the remaining internal keys by (trigram, amount
+    bucket); a processor row is only compared with internal rows that share
+    a trigram in its own or a neighbouring bucket, and overly common
+    postings are skipped, so the work stays near-linear. Pairs need a Dice
+    similarity of at least RECON_FUZZY_MIN_SIMILARITY and are taken
+    greedily, best first. Returns (internal_rows, processor_rows,
+    match_types, similarity) as global positions.
+    """
+    internal_keys = normalize_reference_keys(internal_df['reference_number'].to_numpy(dtype=object)[internal_left])
+    processor_keys = normalize_reference_keys(processor_df['reference_number'].to_numpy(dtype=object)[processor_left])
+    _, internal_amounts, internal_valid = dataset_amounts(internal_df, internal_left)
+    _, processor_amounts, processor_valid = dataset_amounts(processor_df, processor_left)
+    tolerance = amount_tolerance(internal_df)
+    internal_valid &= internal_keys != ''
+    processor_valid &= processor_keys != ''
+
+    # Stage one: equal normalized keys
+    internal_rows, processor_rows, internal_paired, processor_paired = match_columns_one_to_one(
+        internal_keys, internal_amounts, internal_valid, processor_keys, processor_amounts, processor_valid, tolerance
+    )
+    match_types = ['normalized_reference'] * len(internal_rows)
+    similarity = [1.0] * len(internal_rows)
+
+    # Stage two: trigram candidates among what is still unpaired
+    internal_rest = np.flatnonzero(internal_valid & ~internal_paired)
+    processor_rest = np.flatnonzero(processor_valid & ~processor_paired)
+    if len(internal_rest) and len(processor_rest):
+        # Buckets one tolerance wide: amounts within tolerance fall in the same or a neighbouring bucket
+        internal_grams = reference_trigrams(internal_keys[internal_rest], internal_amounts[internal_rest] // (tolerance + 1))
+        processor_grams = reference_trigrams(processor_keys[processor_rest], processor_amounts[processor_rest] // (tolerance + 1))
+        internal_sizes = internal_grams.groupby('row').size().to_numpy()
+        processor_sizes = processor_grams.groupby('row').size().to_numpy()
+        postings = internal_grams.groupby(['gram', 'bucket'])['row'].transform('size')
+        internal_grams = internal_grams[postings <= FUZZY_MAX_POSTINGS]
+        processor_grams = pd.concat([
+            processor_grams.assign(bucket=processor_grams['bucket'] + offset) for offset in (-1, 0, 1)
+        ], ignore_index=True)
+
+        candidates = processor_grams.merge(internal_grams, on=['gram', 'bucket'], suffixes=('_processor', '_internal'))
+        shared = candidates.groupby(['row_internal', 'row_processor']).size()
+        left = shared.index.get_level_values('row_internal').to_numpy()
+        right = shared.index.get_level_values('row_processor').to_numpy()
+        dice = 2 * shared.to_numpy() / (internal_sizes[left] + processor_sizes[right])
+        left, right = internal_rest[left], processor_rest[right]
+        difference = np.abs(internal_amounts[left] - processor_amounts[right])
+        keep = (dice >= FUZZY_MIN_SIMILARITY) & (difference <= tolerance)
+        left, right, dice, difference = left[keep], right[keep], dice[keep], difference[keep]
+
+        # Best pairs first; each row is used once
+        order = np.lexsort((left, right, difference, -dice))
+        used_internal, used_processor = set(), set()
+        fuzzy_internal, fuzzy_processor = [], []
+        for position in order.tolist():
+            i, j = int(left[position]), int(right[position])
+            if i in used_internal or j in used_processor:
+                continue
+            used_internal.add(i)
+            used_processor.add(j)
+            fuzzy_internal.append(i)
+            fuzzy_processor.append(j)
+            similarity.append(round(float(dice[position]), 4))
+        internal_rows = np.concatenate([internal_rows, np.array(fuzzy_internal, dtype=np.int64)])
+        processor_rows = np.concatenate([processor_rows, np.array(fuzzy_processor, dtype=np.int64)])
+        match_types += ['fuzzy_reference'] * len(fuzzy_internal)
+
+    return internal_left[internal_rows], processor_left[processor_rows], match_types, similarity
+
+# Amount + date pass: pairs leftovers with no usable reference by amount tolerance and a date window.
+# Scope 'unreferenced' needs at least one side of a pair without a usable reference; 'all' ignores references.
+DATE_WINDOW_DAYS = int(os.environ.get('RECON_DATE_WINDOW_DAYS', 2))
+AMOUNT_DATE_SCOPE = os.environ.get('RECON_AMOUNT_DATE_SCOPE', 'unreferenced')
+# References that stand for "no reference"; compared after REFERENCE_RULES normalization
+REFERENCE_PLACEHOLDERS = [placeholder for placeholder in os.environ.get(
+    'RECON_REFERENCE_PLACEHOLDERS', 'na,none,null,nan,unknown'
+).split(',') if placeholder]
+
+def pair_by_date(left_amounts, left_days, right_amounts, right_days):
+    """Two-pointer merge of two (amount, day)-sorted sides: equal amounts, days within DATE_WINDOW_DAYS.
+
+    Pairs greedily in date order, which gives the most pairs per amount.
+    Returns the paired positions into each side.
+    """
+    left_amounts, left_days = left_amounts.tolist(), left_days.tolist()
+    right_amounts, right_days = right_amounts.tolist(), right_days.tolist()
+    paired_left, paired_right = [], []
+    i = j = 0
+    while i < len(left_amounts) and j < len(right_amounts):
+        if left_amounts[i] != right_amounts[j]:
+            if left_amounts[i] < right_amounts[j]:
+                i += 1
+            else:
+                j += 1
+            continue
+        difference = left_days[i] - right_days[j]
+        if abs(difference) <= DATE_WINDOW_DAYS:
+            paired_left.append(i)
+            paired_right.append(j)
+            i += 1
+            j += 1
+        elif difference < 0:
+            i += 1
+        else:
+            j += 1
+    return np.array(paired_left, dtype=np.int64), np.array(paired_right, dtype=np.int64)
+
+def unusable_references(keys):
+    """Mask of reference keys that identify nothing: blank after normalization, or a placeholder such as 'N/A'"""
+    normalized = normalize_reference_keys(keys)
+    placeholders = normalize_reference_keys(REFERENCE_PLACEHOLDERS)
+    return (normalized == '') | np.isin(normalized, placeholders)
+
+def pair_within_tolerance(left_amounts, left_days, right_amounts, right_days, tolerance):
+    """Greedy sweep of two (day, amount)-sorted sides: amounts within tolerance, days within DATE_WINDOW_DAYS.
+
+    Left rows in order each take the free right row closest in amount, then
+    in date. Each day of the window is one np.searchsorted for every row's
+    amount band, and taken right rows are skipped through next/previous-free
+    pointers, so the cost does not grow with the tolerance. Returns the
+    paired positions into each side.
+    """
+    # (day, amount rank) as one sortable integer; ranks stay below stride, so the order is lexicographic
+    ranks = np.unique(right_amounts)
+    stride = len(ranks) + 1
+    base = right_days[0]
+    right_keys = (right_days - base) * stride + np.searchsorted(ranks, right_amounts)
+    # Amount ranks of each left row's band start, own amount and band end
+    left_ranks = [np.searchsorted(ranks, left_amounts - tolerance, 'left'), np.searchsorted(ranks, left_amounts, 'left'),
+                  np.searchsorted(ranks, left_amounts + tolerance, 'right')]
+    bands = np.array([
+        [np.searchsorted(right_keys, (left_days + offset - base) * stride + rank) for rank in left_ranks]
+        for offset in range(-DATE_WINDOW_DAYS, DATE_WINDOW_DAYS + 1)
+    ])
+    # Only left rows with a non-empty band on some day of the window can pair
+    candidates = np.flatnonzero((bands[:, 2] > bands[:, 0]).any(axis=0))
+    bands = bands[:, :, candidates].transpose(2, 0, 1).tolist()
+    
+    # next_free[j]: first free position >= j (len(right) when none); previous_free[j + 1]: last free <= j (-1 when none)
+    next_free = list(range(len(right_amounts) + 1))
+    previous_free = list(range(-1, len(right_amounts)))
+    
+    def find(pointers, position, shift=0):
+        root = position
+        while pointers[root + shift] != root:
+            root = pointers[root + shift]
+        while pointers[position + shift] != root:
+            pointers[position + shift], position = root, pointers[position + shift]
+        return root
+    
+    left_amounts, left_days = left_amounts.tolist(), left_days.tolist()
+    right_amounts, right_days = right_amounts.tolist(), right_days.tolist()
+    paired_left, paired_right = [], []
+    for i, windows in zip(candidates.tolist(), bands):
+        amount, day = left_amounts[i], left_days[i]
+        best = best_distance = None
+        for start, middle, stop in windows:
+            if start == stop:
+                continue
+            for j in (find(next_free, middle), find(previous_free, middle - 1, 1)):
+                if start <= j < stop:
+                    distance = (abs(right_amounts[j] - amount), abs(right_days[j] - day))
+                    if best is None or distance < best_distance:
+                        best, best_distance = j, distance
+        if best is not None:
+            paired_left.append(i)
+            paired_right.append(best)
+            next_free[best] = best + 1
+            previous_free[best + 1] = best - 1
+    return np.array(paired_left, dtype=np.int64), np.array(paired_right, dtype=np.int64)
+
+def pair_amount_date_rows(internal_amounts, internal_days, internal_rows,
+                          processor_amounts, processor_days, processor_rows, tolerance):
+    """Equal amounts by one sorted merge-join, then with a tolerance one band sweep over the rest.
+
+    Returns the paired positions of each side.
+    """
+    empty = np.array([], dtype=np.int64)
+    if not len(internal_rows) or not len(processor_rows):
+        return empty, empty
+    internal_rows = internal_rows[np.lexsort((internal_rows, internal_days[internal_rows], internal_amounts[internal_rows]))]
+    processor_rows = processor_rows[np.lexsort((processor_rows, processor_days[processor_rows], processor_amounts[processor_rows]))]
+    paired_internal, paired_processor = pair_by_date(
+        internal_amounts[internal_rows], internal_days[internal_rows],
+        processor_amounts[processor_rows], processor_days[processor_rows]
+    )
+    matched_internal, matched_processor = [internal_rows[paired_internal]], [processor_rows[paired_processor]]
+    internal_rows = np.delete(internal_rows, paired_internal)
+    processor_rows = np.delete(processor_rows, paired_processor)
+    
+    if tolerance and len(internal_rows) and len(processor_rows):
+        internal_rows = internal_rows[np.lexsort((internal_rows, internal_amounts[internal_rows], internal_days[internal_rows]))]
+        processor_rows = processor_rows[np.lexsort((processor_rows, processor_amounts[processor_rows], processor_days[processor_rows]))]
+        paired_internal, paired_processor = pair_within_tolerance(
+            internal_amounts[internal_rows], internal_days[internal_rows],
+            processor_amounts[processor_rows], processor_days[processor_rows], tolerance
+        )
+        matched_internal.append(internal_rows[paired_internal])
+        matched_processor.append(processor_rows[paired_processor])
+    return np.concatenate(matched_internal), np.concatenate(matched_processor)
+
+def amount_date_pass(internal_df, processor_df, internal_left, processor_left):
+    """Match leftovers by amount within tolerance and transaction date within DATE_WINDOW_DAYS.
+
+    With AMOUNT_DATE_SCOPE 'unreferenced' a pair needs at least one side
+    without a usable reference: internal rows without one are tried against
+    every processor leftover, then the rest against processor rows without
+    one. With 'all' references are ignored. Each round pairs equal amounts
+    first, then the rest within the currency's tolerance, closest amount
+    first (see pair_amount_date_rows). Rows without a valid
+    amount or date are skipped. Returns (internal_rows, processor_rows,
+    match_types, similarity) as global positions.
+    """
+    if 'transaction_date' not in internal_df.columns or 'transaction_date' not in processor_df.columns:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), [], []
+
+    sides = []
+    for df, leftover in ((internal_df, internal_left), (processor_df, processor_left)):
+        _, amounts, valid = dataset_amounts(df, leftover)
+        dates = df['transaction_date'].to_numpy()[leftover]
+        valid &= ~np.isnat(dates)
+        unreferenced = unusable_references(df['reference_number'].to_numpy(dtype=object)[leftover])
+        sides.append((amounts, dates.astype('datetime64[D]').astype(np.int64), valid, unreferenced))
+    (internal_amounts, internal_days, internal_valid, internal_unreferenced), \
+        (processor_amounts, processor_days, processor_valid, processor_unreferenced) = sides
+
+    if AMOUNT_DATE_SCOPE == 'all':
+        rounds = [(internal_valid, processor_valid)]
+    else:
+        rounds = [(internal_valid & internal_unreferenced, processor_valid),
+                  (internal_valid, processor_valid & processor_unreferenced)]
+
+    tolerance = amount_tolerance(internal_df)
+    internal_free = np.ones(len(internal_left), dtype=bool)
+    processor_free = np.ones(len(processor_left), dtype=bool)
+    matched_internal, matched_processor = [], []
+    for internal_candidates, processor_candidates in rounds:
+        paired_internal, paired_processor = pair_amount_date_rows(
+            internal_amounts, internal_days, np.flatnonzero(internal_candidates & internal_free),
+            processor_amounts, processor_days, np.flatnonzero(processor_candidates & processor_free), tolerance
+        )
+        internal_free[paired_internal] = False
+        processor_free[paired_processor] = False
+        matched_internal.append(paired_internal)
+        matched_processor.append(paired_processor)
+
+    matched_internal = internal_left[np.concatenate(matched_internal)]
+    matched_processor = processor_left[np.concatenate(matched_processor)]
+    return matched_internal, matched_processor, ['amount_date'] * len(matched_internal), [None] * len(matched_internal)
+
+LEFTOVER_PASS_FUNCTIONS = {
+    'fuzzy_reference': fuzzy_reference_pass,
+    'amount_date': amount_date_pass
+}
+
+def apply_leftover_passes(internal_df, processor_df, matches_df, internal_matched, processor_matched):
+    """Run LEFTOVER_PASSES; returns extended matches and masks plus a report of the pairs they added"""
+    found = []
+    for name in LEFTOVER_PASSES:
+        internal_rows, processor_rows, match_types, similarity = LEFTOVER_PASS_FUNCTIONS[name](
+            internal_df, processor_df, np.flatnonzero(~internal_matched), np.flatnonzero(~processor_matched)
+        )
+        internal_matched[internal_rows] = True
+        processor_matched[processor_rows] = True
+        found.append(pd.DataFrame({
+            'internal_reference': internal_df['reference_number'].to_numpy(dtype=object)[internal_rows],
+            'processor_reference': processor_df['reference_number'].to_numpy(dtype=object)[processor_rows],
+            'internal_amount': internal_df['amount'].to_numpy()[internal_rows],
+            'processor_amount': processor_df['amount'].to_numpy()[processor_rows],
+            'processor': processor_df['processor_name'].to_numpy(dtype=object)[processor_rows],
+            'match_type': match_types,
+            'similarity': similarity,
+            'currency': internal_df['currency'].to_numpy(dtype=object)[internal_rows]
+        }, columns=LEFTOVER_MATCH_COLUMNS))
+
+    leftover_df = pd.concat(found, ignore_index=True) if found else EMPTY_LEFTOVER_MATCHES
+    if len(leftover_df):
+        extra = leftover_df.rename(columns={'internal_reference': 'reference'})[MATCH_COLUMNS]
+        matches_df = pd.concat([matches_df, extra], ignore_index=True)
+    return matches_df, internal_matched, processor_matched, leftover_df
+
+for name in LEFTOVER_PASSES:
+    if name not in LEFTOVER_PASS_FUNCTIONS:
+        raise ValueError(f'Unknown leftover pass: {name}')
+if AMOUNT_DATE_SCOPE not in ('unreferenced', 'all'):
+    raise ValueError(f'Unknown amount/date scope: {AMOUNT_DATE_SCOPE}')
+
+# Storage backends
+class MemoryStorage:
+    """Datasets and history held in this process; not shared between workers or kept across restarts"""
+
+    def __init__(self):
+        # Every dataset is a DataFrame with normalized string references, float64 amounts and
+        # categorical currency/processor; each instance starts empty
+        self.data = {module: {currency: empty_slot() for currency in CURRENCIES} for module in MODULES}
+        self.history = deque(maxlen=HISTORY_RETENTION)
+        self.instance = f'memory-{uuid.uuid4().hex[:12]}'
+        self.history_id = 0
+        self.statistics = empty_statistics()
+        self.versions = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.job_results = {}
+        self.incremental_cursors = {}
+
+    def next_version(self):
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def get_slot(self, module, currency):
+        """Internal and processor datasets plus their (internal, processor) version pair"""
+        slot = self.data[module][currency]
+        return {
+            'internal': slot['internal'],
+            'processor_data': slot['processor_data'],
+            'version': self.versions.get((module, currency), (0, 0))
+        }
+
+    def set_internal(self, module, currency, datasets):
+        self.data[module][currency]['internal'] = concat_datasets(datasets)
+        _, processor_version = self.versions.get((module, currency), (0, 0))
+        self.versions[(module, currency)] = (self.next_version(), processor_version)
+
+    def append_processor(self, module, currency, datasets):
+        slot = self.data[module][currency]
+        slot['processor_data'] = concat_datasets([slot['processor_data']] + datasets)
+        internal_version, _ = self.versions.get((module, currency), (0, 0))
+        self.versions[(module, currency)] = (internal_version, self.next_version())
+
+    def snapshot_references(self):
+        """Snapshot keys stored uploads need again; none here, loaded frames stay in memory"""
+        return set()
+
+    def incremental_cursor(self, module, currency, internal_version):
+        """Processor rows already reported by incremental runs on this internal upload"""
+        with self.lock:
+            version, reported = self.incremental_cursors.get((module, currency), (None, 0))
+        return reported if version == internal_version else 0
+
+    def advance_incremental_cursor(self, module, currency, internal_version, processor_rows):
+        """Record processor_rows as reported, unless a newer upload or a later run already moved past it"""
+        with self.lock:
+            current = self.incremental_cursors.get((module, currency), (0, 0))
+            self.incremental_cursors[(module, currency)] = max(current, (internal_version, processor_rows))
+
+    def add_history(self, entry):
+        with self.lock:
+            self.history_id += 1
+            self.history.append(dict(entry, id=self.history_id))
+            add_statistics(self.statistics, entry)
+
+    def get_statistics(self):
+        with self.lock:
+            return dict(self.statistics)
+
+    def query_history(self, limit, module=None, currency=None, since=None, until=None, before_id=None):
+        """Newest-first history entries matching the filters; timestamps are compared as ISO strings"""
+        page = []
+        with self.lock:
+            for entry in reversed(self.history):
+                if (before_id is None or entry['id'] < before_id) \
+                        and (module is None or entry['module'] == module) \
+                        and (currency is None or entry['currency'] == currency) \
+                        and (since is None or entry['timestamp'] >= since) \
+                        and (until is None or entry['timestamp'] < until):
+                    page.append(entry)
+                    if len(page) == limit:
+                        break
+        return page
+
+    def save_job(self, job):
+        with self.lock:
+            self.jobs[job['job_id']] = json.loads(json.dumps(job))
+            self.jobs.move_to_end(job['job_id'])
+            while len(self.jobs) > JOB_RETENTION:
+                job_id, _ = self.jobs.popitem(last=False)
+                self.job_results.pop(job_id, None)
+
+    def get_job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def save_job_result(self, job_id, payload):
+        self.job_results[job_id] = payload
+
+    def get_job_result(self, job_id):
+        return self.job_results.get(job_id)
+
+class SQLiteStorage:
+    """Datasets and history in a SQLite database so every gunicorn worker sees the same state.
+
+    Uploads are stored as ingest batches in dataset_blob form, or as a JSON
+    reference to their snapshot. Each worker keeps the loaded frames in memory and only re-reads a slot when its upload ids
+    change; processor uploads are loaded incrementally.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS uploads (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            module TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            rows INTEGER NOT NULL,
+            created TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS uploads_slot ON uploads (module, currency, kind, id);
+        CREATE TABLE IF NOT EXISTS upload_batches (
+            upload_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (upload_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS incremental_cursors (
+            module TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            internal_version INTEGER NOT NULL,
+            processor_rows INTEGER NOT NULL,
+            PRIMARY KEY (module, currency)
+        );
+        CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id TEXT NOT NULL UNIQUE,
+            job TEXT NOT NULL,
+            result TEXT
+        );
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            module TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            entry TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS history_slot ON history (module, currency, id);
+        CREATE TABLE IF NOT EXISTS history_totals (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_reconciliations INTEGER NOT NULL,
+            total_matched INTEGER NOT NULL,
+            total_unmatched_internal INTEGER NOT NULL,
+            total_unmatched_processor INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO history_totals
+            SELECT 1, COUNT(*),
+                   COALESCE(SUM(json_extract(entry, '$.matched_count')), 0),
+                   COALESCE(SUM(json_extract(entry, '$.unmatched_internal_count')), 0),
+                   COALESCE(SUM(json_extract(entry, '$.unmatched_processor_count')), 0)
+            FROM history;
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.instance = f'sqlite-{os.path.abspath(path)}'
+        self.local = threading.local()
+        self.cache = {}
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self.connect()
+        with connection:
+            connection.executescript(self.SCHEMA)
+        if MIGRATE_PICKLES:
+            self.migrate_pickled_batches()
+
+    def connect(self):
+        """Connection for the current thread, reopened after a fork"""
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def latest_upload(self, connection, module, currency, kind):
+        row = connection.execute(
+            'SELECT MAX(id) FROM uploads WHERE module = ? AND currency = ? AND kind = ?',
+            (module, currency, kind)
+        ).fetchone()
+        return row[0] or 0
+
+    def load_batches(self, connection, module, currency, kind, after_id, upto_id):
+        rows = connection.execute(
+            '''SELECT b.data FROM upload_batches b JOIN uploads u ON u.id = b.upload_id
+               WHERE u.module = ? AND u.currency = ? AND u.kind = ? AND u.id > ? AND u.id <= ?
+               ORDER BY u.id, b.seq''',
+            (module, currency, kind, after_id, upto_id)
+        )
+        return [self.load_batch(data) for (data,) in rows]
+
+    def load_batch(self, data):
+        if data[:1] == b'{':
+            key = json.loads(data)['snapshot']
+            dataset = load_snapshot(key)
+            if dataset is None:
+                raise FileNotFoundError(f"Snapshot {key} is missing from {SNAPSHOT_DIR}")
+            return dataset
+        if data[:1] == b'\x80':
+            raise ValueError('Upload batch was pickled by an earlier version; set RECON_MIGRATE_PICKLES=1 once to convert it')
+        return load_dataset_blob(data)
+
+    def get_slot(self, module, currency):
+        """Internal and processor datasets plus their (internal, processor) version pair"""
+        connection = self.connect()
+        internal_id = self.latest_upload(connection, module, currency, 'internal')
+        processor_id = self.latest_upload(connection, module, currency, 'processor')
+
+        with self.lock:
+            cached = self.cache.get((module, currency)) or {
+                'internal': empty_dataset(),
+                'processor_data': empty_dataset(processor=True),
+                'version': (0, 0)
+            }
+            cached_internal, cached_processor = cached['version']
+            slot = dict(cached, version=(internal_id, processor_id))
+
+            if internal_id != cached_internal:
+                batches = self.load_batches(connection, module, currency, 'internal', internal_id - 1, internal_id)
+                slot['internal'] = concat_datasets(batches or [empty_dataset()])
+            if processor_id < cached_processor:
+                cached_processor = 0
+                slot['processor_data'] = empty_dataset(processor=True)
+            if processor_id != cached_processor:
+                batches = self.load_batches(connection, module, currency, 'processor', cached_processor, processor_id)
+                slot['processor_data'] = concat_datasets([slot['processor_data']] + batches)
+
+            self.cache[(module, currency)] = slot
+        return dict(slot)
+
+    def save_upload(self, connection, module, currency, kind, datasets):
+        cursor = connection.execute(
+            'INSERT INTO uploads (module, currency, kind, rows, created) VALUES (?, ?, ?, ?, ?)',
+            (module, currency, kind, sum(len(dataset) for dataset in datasets), datetime.now().isoformat())
+        )
+        # Snapshotted datasets are stored as a reference to their snapshot, which every worker maps
+        connection.executemany(
+            'INSERT INTO upload_batches (upload_id, seq, data) VALUES (?, ?, ?)',
+            [(cursor.lastrowid, seq, json.dumps({'snapshot': dataset.attrs['snapshot']}).encode()
+              if dataset.attrs.get('snapshot') else dataset_blob(dataset))
+             for seq, dataset in enumerate(datasets)]
+        )
+        return cursor.lastrowid
+
+    def snapshot_references(self):
+        """Snapshot keys referenced by stored uploads; only snapshot markers are small enough to pass the filter"""
+        rows = self.connect().execute('SELECT data FROM upload_batches WHERE length(data) < 1024')
+        references = set()
+        for (data,) in rows:
+            if data[:1] == b'{':
+                references.add(json.loads(data)['snapshot'])
+            elif data[:1] == b'\x80':
+                # Markers pickled by an earlier version keep their snapshot until they are migrated
+                references.update(SNAPSHOT_KEY.findall(data.decode('latin-1')))
+        return references
+
+    def migrate_pickled_batches(self):
+        """Rewrite upload batches pickled by earlier versions in the current format; returns how many"""
+        connection = self.connect()
+        keys = connection.execute("SELECT upload_id, seq FROM upload_batches WHERE substr(data, 1, 1) = X'80'").fetchall()
+        for upload_id, seq in keys:
+            (data,) = connection.execute(
+                'SELECT data FROM upload_batches WHERE upload_id = ? AND seq = ?', (upload_id, seq)
+            ).fetchone()
+            batch = pickle.loads(data)
+            if isinstance(batch, dict):
+                migrate_snapshot(batch['snapshot'])
+                data = json.dumps({'snapshot': batch['snapshot']}).encode()
+            else:
+                data = dataset_blob(batch)
+            with connection:
+                connection.execute(
+                    'UPDATE upload_batches SET data = ? WHERE upload_id = ? AND seq = ?', (data, upload_id, seq)
+                )
+        return len(keys)
+
+    def set_internal(self, module, currency, datasets):
+        connection = self.connect()
+        with connection:
+            upload_id = self.save_upload(connection, module, currency, 'internal', datasets)
+            connection.execute(
+                '''DELETE FROM upload_batches WHERE upload_id IN (
+                       SELECT id FROM uploads WHERE module = ? AND currency = ? AND kind = 'internal' AND id < ?)''',
+                (module, currency, upload_id)
+            )
+            connection.execute(
+                "DELETE FROM uploads WHERE module = ? AND currency = ? AND kind = 'internal' AND id < ?",
+                (module, currency, upload_id)
+            )
+
+    def append_processor(self, module, currency, datasets):
+        connection = self.connect()
+        with connection:
+            self.save_upload(connection, module, currency, 'processor', datasets)
+
+    def incremental_cursor(self, module, currency, internal_version):
+        """Processor rows already reported by incremental runs on this internal upload"""
+        row = self.connect().execute(
+            'SELECT processor_rows FROM incremental_cursors WHERE module = ? AND currency = ? AND internal_version = ?',
+            (module, currency, internal_version)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def advance_incremental_cursor(self, module, currency, internal_version, processor_rows):
+        """Record processor_rows as reported, unless a newer upload or a later run already moved past it"""
+        connection = self.connect()
+        with connection:
+            connection.execute(
+                '''INSERT INTO incremental_cursors VALUES (?, ?, ?, ?)
+                ON CONFLICT (module, currency) DO UPDATE SET
+                    internal_version = excluded.internal_version, processor_rows = excluded.processor_rows
+                WHERE excluded.internal_version > internal_version
+                    OR (excluded.internal_version = internal_version AND excluded.processor_rows > processor_rows)''',
+                (module, currency, internal_version, processor_rows)
+            )
+
+    def add_history(self, entry):
+        connection = self.connect()
+        with connection:
+            cursor = connection.execute(
+                'INSERT INTO history (module, currency, timestamp, entry) VALUES (?, ?, ?, ?)',
+                (entry['module'], entry['currency'], entry['timestamp'], json.dumps(entry))
+            )
+            connection.execute(
+                '''UPDATE history_totals SET
+                       total_reconciliations = total_reconciliations + 1,
+                       total_matched = total_matched + ?,
+                       total_unmatched_internal = total_unmatched_internal + ?,
+                       total_unmatched_processor = total_unmatched_processor + ?
+                   WHERE id = 1''',
+                [entry.get(field, 0) for field in STATISTICS_FIELDS.values()]
+            )
+            connection.execute('DELETE FROM history WHERE id <= ?', (cursor.lastrowid - HISTORY_RETENTION,))
+
+    def get_statistics(self):
+        row = self.connect().execute(
+            '''SELECT total_reconciliations, total_matched, total_unmatched_internal, total_unmatched_processor
+               FROM history_totals WHERE id = 1'''
+        ).fetchone()
+        return dict(zip(['total_reconciliations', *STATISTICS_FIELDS], row))
+
+    def query_history(self, limit, module=None, currency=None, since=None, until=None, before_id=None):
+        """Newest-first history entries matching the filters; timestamps are compared as ISO strings"""
+        clauses, params = [], []
+        for clause, value in (('id < ?', before_id), ('module = ?', module), ('currency = ?', currency),
+                              ('timestamp >= ?', since), ('timestamp < ?', until)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self.connect().execute(
+            f'SELECT id, entry FROM history {where} ORDER BY id DESC LIMIT ?', (*params, limit)
+        )
+        return [dict(json.loads(entry), id=entry_id) for entry_id, entry in rows]
+
+    def save_job(self, job):
+        connection = self.connect()
+        with connection:
+            connection.execute(
+                '''INSERT INTO jobs (job_id, job) VALUES (?, ?)
+                   ON CONFLICT (job_id) DO UPDATE SET job = excluded.job''',
+                (job['job_id'], json.dumps(job))
+            )
+            connection.execute(
+                'DELETE FROM jobs WHERE seq <= (SELECT MAX(seq) FROM jobs) - ?', (JOB_RETENTION,)
+            )
+
+    def get_job(self, job_id):
+        row = self.connect().execute('SELECT job FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_job_result(self, job_id, payload):
+        connection = self.connect()
+        with connection:
+            connection.execute('UPDATE jobs SET result = ? WHERE job_id = ?', (json.dumps(payload), job_id))
+
+    def get_job_result(self, job_id):
+        row = self.connect().execute('SELECT result FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+def create_storage(backend):
+    """Build the configured storage backend"""
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(os.path.join(DATA_DIR, 'reconciliation.db'))
+    raise ValueError(f'Unknown storage backend: {backend}')
+
+storage = create_storage(STORAGE_BACKEND)
+
+# Open items carried across days: unmatched internal rows of earlier uploads stay matchable by later
+# processor files (full reconciliations only). Processor data is append-only, so it needs no carrying.
+CARRY_FORWARD = os.environ.get('RECON_CARRY_FORWARD', '0') == '1'
+OPEN_ITEMS_MAX_AGE_DAYS = int(os.environ.get('RECON_OPEN_ITEMS_MAX_AGE_DAYS', 30))
+CARRIED_MATCH_COLUMNS = [
+    'reference', 'internal_amount', 'processor_amount', 'processor', 'match_type',
+    'internal_date', 'carried_since', 'currency'
+]
+EMPTY_CARRIED_MATCHES = pd.DataFrame(columns=CARRIED_MATCH_COLUMNS)
+
+class OpenItemsIndex:
+    """Unmatched internal rows in SQLite, keyed by slot and normalized reference.
+
+    Every item records the internal upload it came from. A run replaces the
+    items of the slot's current upload with its still-unmatched rows and looks
+    its unmatched processor references up against items of earlier uploads
+    through an indexed join, so no history is loaded into memory. Paired
+    items are retired (status 'matched'); items older than
+    OPEN_ITEMS_MAX_AGE_DAYS are dropped. Only explicit runs record; other
+    lookups see the same pairs without writing.
+    """
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS open_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            module TEXT NOT NULL,
+            currency TEXT NOT NULL,
+            origin TEXT NOT NULL,
+            reference TEXT NOT NULL,
+            amount REAL,
+            amount_minor INTEGER NOT NULL,
+            transaction_date TEXT,
+            status TEXT NOT NULL,
+            created TEXT NOT NULL,
+            matched_at TEXT
+        );
+        CREATE INDEX IF NOT EXISTS open_items_reference ON open_items (module, currency, reference);
+        CREATE INDEX IF NOT EXISTS open_items_origin ON open_items (module, currency, origin);
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self.connect()
+        with connection:
+            connection.executescript(self.SCHEMA)
+
+    def connect(self):
+        """Connection for the current thread, reopened after a fork"""
+        if getattr(self.local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('CREATE TEMP TABLE IF NOT EXISTS lookup_references (reference TEXT PRIMARY KEY)')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    def carry_forward(self, module, currency, origin, internal_df, internal_rows, processor_df, processor_rows,
+                      record=True):
+        """Pair unmatched processor rows with open items of earlier uploads.
+
+        With record, paired items are retired, the others reopened and this
+        upload's unmatched rows stored as open items; without, nothing is
+        written. Returns (paired processor rows, carried matches DataFrame).
+        """
+        now = datetime.now()
+        cutoff = (now - timedelta(days=OPEN_ITEMS_MAX_AGE_DAYS)).isoformat()
+        processor_keys = processor_df['reference_number'].to_numpy(dtype=object)[processor_rows]
+        _, processor_minor, processor_valid = dataset_amounts(processor_df, processor_rows)
+        
+        connection = self.connect()
+        with connection:
+            slot = (module, currency)
+            if record:
+                connection.execute(
+                    'DELETE FROM open_items WHERE module = ? AND currency = ? AND (origin = ? OR created < ?)',
+                    (*slot, origin, cutoff)
+                )
+            
+            # Keyed lookup of this run's unmatched processor references
+            connection.execute('DELETE FROM lookup_references')
+            connection.executemany(
+                'INSERT OR IGNORE INTO lookup_references (reference) VALUES (?)',
+                ((key,) for key in pd.unique(processor_keys[processor_valid]) if key)
+            )
+            items = pd.DataFrame(connection.execute(
+                '''SELECT i.id, i.reference, i.amount, i.amount_minor, i.transaction_date, i.created
+                   FROM lookup_references r JOIN open_items i
+                     ON i.module = ? AND i.currency = ? AND i.reference = r.reference
+                   WHERE i.origin != ? AND i.created >= ?
+                   ORDER BY i.id''',
+                (*slot, origin, cutoff)
+            ).fetchall(), columns=['id', 'reference', 'amount', 'amount_minor', 'transaction_date', 'created'])
+            
+            # Items already retired by these same processor rows in an earlier run pair again
+            item_rows, paired_rows, _, _ = match_columns_one_to_one(
+                items['reference'].to_numpy(dtype=object), items['amount_minor'].to_numpy(dtype=np.int64),
+                np.ones(len(items), dtype=bool),
+                processor_keys, processor_minor, processor_valid, amount_tolerance(internal_df)
+            )
+            if record:
+                paired = np.zeros(len(items), dtype=bool)
+                paired[item_rows] = True
+                connection.executemany(
+                    "UPDATE open_items SET status = 'matched', matched_at = ? WHERE id = ?",
+                    ((now.isoformat(), int(item_id)) for item_id in items['id'].to_numpy()[paired])
+                )
+                connection.executemany(
+                    "UPDATE open_items SET status = 'open', matched_at = NULL WHERE id = ?",
+                    ((int(item_id),) for item_id in items['id'].to_numpy()[~paired])
+                )
+            
+                # This upload's unmatched rows become open items for later runs
+                internal_keys = internal_df['reference_number'].to_numpy(dtype=object)[internal_rows]
+                internal_values, internal_minor, internal_valid = dataset_amounts(internal_df, internal_rows)
+                if 'transaction_date' in internal_df.columns:
+                    internal_dates = internal_df['transaction_date'].iloc[internal_rows].dt.strftime('%Y-%m-%d')
+                    internal_dates = internal_dates.astype(object).where(internal_dates.notna(), None).to_numpy()
+                else:
+                    internal_dates = np.full(len(internal_rows), None, dtype=object)
+                keep = np.flatnonzero(internal_valid & (internal_keys != ''))
+                created = now.isoformat()
+                connection.executemany(
+                    '''INSERT INTO open_items
+                           (module, currency, origin, reference, amount, amount_minor, transaction_date, status, created)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, 'open', ?)''',
+                    ((module, currency, origin, key, value, minor, date, created) for key, value, minor, date in zip(
+                        internal_keys[keep], internal_values[keep].tolist(), internal_minor[keep].tolist(), internal_dates[keep]
+                    ))
+                )
+        
+        processor_rows = processor_rows[paired_rows]
+        carried = pd.DataFrame({
+            'reference': items['reference'].to_numpy(dtype=object)[item_rows],
+            'internal_amount': items['amount'].to_numpy()[item_rows],
+            'processor_amount': processor_df['amount'].to_numpy()[processor_rows],
+            'processor': processor_df['processor_name'].to_numpy(dtype=object)[processor_rows],
+            'match_type': 'carried_forward',
+            'internal_date': items['transaction_date'].to_numpy(dtype=object)[item_rows],
+            'carried_since': items['created'].to_numpy(dtype=object)[item_rows],
+            'currency': currency
+        }, columns=CARRIED_MATCH_COLUMNS)
+        return processor_rows, carried
+
+open_items = OpenItemsIndex(os.path.join(DATA_DIR, 'open_items.db')) if CARRY_FORWARD else None
+
 # Calculate overall statistics
 def get_overall_statistics():
     """Get overall statistics for all modules and currencies"""
-    total_reconciliations = len(reconciliation_history)
+    return storage.get_statistics()
+
+def combine_statistics(history):
+    """Totals over a list of history entries"""
+    totals = empty_statistics()
+    for recon in history:
+        add_statistics(totals, recon)
+    return totals
+
+# Reconciliation results, cached per (module, currency, engine) and keyed by the slot's dataset version
+RESULT_CACHE_SIZE = int(os.environ.get('RECON_RESULT_CACHE_SIZE', 8))
+result_cache = OrderedDict()
+result_cache_lock = threading.Lock()
+
+def validate_selection(module, currency, engine):
+    """Error message for an invalid module/currency/engine selection, or None"""
+    if module not in MODULES or currency not in CURRENCIES:
+        return 'Unknown module or currency'
+    if engine not in MATCH_ENGINES:
+        return f'Unknown matching engine: {engine}'
+    return None
+
+def match_slot(internal_df, processor_df, engine, progress=None):
+    """Engine match plus leftover passes; returns (matches, internal mask, processor mask, leftover matches)"""
+    progress = progress or no_progress
+    progress('matching', internal_rows=len(internal_df), processor_rows=len(processor_df))
+    matches_df, internal_matched, processor_matched = MATCH_ENGINES[engine](internal_df, processor_df)
+    if LEFTOVER_PASSES:
+        progress('leftover_passes', rows_matched=len(matches_df))
+    return apply_leftover_passes(internal_df, processor_df, matches_df, internal_matched, processor_matched)
+
+def run_reconciliation(module, currency, slot, engine, progress=None, record=False):
+    """Match one slot's datasets and summarize; keeps frames and matched masks for reports.
+
+    record is set for explicit runs (POST /reconcile, batches and jobs),
+    which update the open items; other requests only look them up.
+    """
+    internal_df = slot['internal']
+    processor_df = slot['processor_data']
+    progress = progress or no_progress
+    
+    # Match with the selected engine
+    matches_df, internal_matched, processor_matched, leftover_df = match_slot(internal_df, processor_df, engine, progress)
+    
+    # Unmatched processor rows against internal items carried from earlier uploads
+    carried_df = EMPTY_CARRIED_MATCHES
+    if open_items is not None and len(internal_df):
+        progress('carry_forward', rows_matched=len(matches_df))
+        carried_rows, carried_df = open_items.carry_forward(
+            module, currency, f"{storage.instance}:{slot['version'][0]}",
+            internal_df, np.flatnonzero(~internal_matched), processor_df, np.flatnonzero(~processor_matched), record
+        )
+        processor_matched[carried_rows] = True
+        if len(carried_df):
+            matches_df = pd.concat([matches_df, carried_df[MATCH_COLUMNS]], ignore_index=True)
+    progress('aggregating', rows_matched=len(matches_df))
+    
+    result = build_result(slot, engine, matches_df, internal_matched, processor_matched)
+    result['leftover_matches'] = leftover_df
+    result['carried_matches'] = carried_df
+    result['recorded'] = record
+    return result
+
+def build_result(slot, engine, matches_df, internal_matched, processor_matched):
+    """Summary and unmatched breakdown for a set of matches and matched masks"""
+    internal_df = slot['internal']
+    processor_df = slot['processor_data']
+    
+    # Totals are plain sums over the minor-unit amounts (integer sums stay exact in float64 below
+    # 2**53); the per-processor breakdown is one weighted bincount over the unmatched rows only
+    decimals = CURRENCY_DECIMALS.get(dataset_currency(internal_df) or dataset_currency(processor_df), 2)
+    internal_minor = dataset_amounts(internal_df)[1]
+    processor_minor = dataset_amounts(processor_df)[1]
+    internal_unmatched = ~internal_matched
+    processor_unmatched = ~processor_matched
+    
+    processor_names = processor_df['processor_name'].cat.categories
+    unmatched_codes = processor_df['processor_name'].cat.codes.to_numpy()[processor_unmatched]
+    unmatched_minor = processor_minor[processor_unmatched]
+    breakdown_counts = np.bincount(unmatched_codes, minlength=len(processor_names))
+    breakdown_values = np.bincount(unmatched_codes, weights=unmatched_minor, minlength=len(processor_names))
+    
+    def major(minor_total):
+        return round(float(minor_total) / 10 ** decimals, decimals)
+    
+    # Unmatched breakdown by processor
+    unmatched_breakdown = {'processors': {
+        name: {'count': int(count), 'value': major(value)}
+        for name, count, value in zip(processor_names, breakdown_counts, breakdown_values)
+        if count > 0
+    }}
+    
+    # Calculate comprehensive summary
+    unmatched_internal_count = int(internal_unmatched.sum())
+    unmatched_processor_count = len(unmatched_codes)
+    unmatched_internal_minor = internal_minor[internal_unmatched].sum()
+    unmatched_processor_minor = unmatched_minor.sum()
+    unmatched_internal_value = major(unmatched_internal_minor)
+    unmatched_processor_value = major(unmatched_processor_minor)
+    
+    summary = {
+        'total_internal': len(internal_df),
+        'total_processor': len(processor_df),
+        'total_internal_value': major(internal_minor.sum()),
+        'total_processor_value': major(processor_minor.sum()),
+        'matched_count': len(matches_df),
+        'matched_value': round(float(matches_df['internal_amount'].sum()), decimals),
+        'unmatched_internal_count': unmatched_internal_count,
+        'unmatched_internal_value': unmatched_internal_value,
+        'unmatched_processor_count': unmatched_processor_count,
+        'unmatched_processor_value': unmatched_processor_value,
+        'unmatched_total': unmatched_internal_count + unmatched_processor_count,
+        'unmatched_total_value': major(unmatched_internal_minor + unmatched_processor_minor)
+    }
+    
+    return {
+        'version': slot['version'],
+        'engine': engine,
+        'internal': internal_df,
+        'processor_data': processor_df,
+        'matches': matches_df,
+        'internal_matched': internal_matched,
+        'processor_matched': processor_matched,
+        'unmatched_breakdown': unmatched_breakdown,
+        'summary': summary
+    }
+
+def get_reconciliation(module, currency, engine, progress=None, record=False):
+    """Reconciliation result for the slot's current uploads, reusing the cached one when unchanged.
+
+    With record (explicit runs) a cached result is reused only if it was
+    recorded too, so carry-forward runs once per upload version.
+    """
+    progress = progress or no_progress
+    progress('loading')
+    slot = storage.get_slot(module, currency)
+    key = (module, currency, engine)
+    cached = cached_reconciliation(key, slot['version'])
+    if cached is not None and (not record or open_items is None or cached.get('recorded')):
+        return cached
+    
+    result = run_reconciliation(module, currency, slot, engine, progress, record)
+    cache_reconciliation(key, result)
+    return result
+
+def cached_reconciliation(key, version):
+    """Cached result for a (module, currency, engine) key if it was built from this upload version"""
+    with result_cache_lock:
+        cached = result_cache.get(key)
+        if cached is not None and cached['version'] == version:
+            result_cache.move_to_end(key)
+            return cached
+    return None
+
+def cache_reconciliation(key, result):
+    """Store a result, evicting the least recently used beyond RESULT_CACHE_SIZE"""
+    with result_cache_lock:
+        result_cache[key] = result
+        result_cache.move_to_end(key)
+        while len(result_cache) > RESULT_CACHE_SIZE:
+            result_cache.popitem(last=False)
+
+def invalidate_reconciliation(module, currency):
+    """Drop cached results for a slot after an upload"""
+    with result_cache_lock:
+        for key in [key for key in result_cache if key[:2] == (module, currency)]:
+            del result_cache[key]
+
+def unmatched_internal_frame(result, start=0, stop=None):
+    """Unmatched internal rows in report layout, optionally only positions start:stop of them"""
+    positions = np.flatnonzero(~result['internal_matched'])[start:stop]
+    rows = result['internal'].iloc[positions]
+    return pd.DataFrame({
+        'reference': rows['reference_number'],
+        'amount': rows['amount'],
+        'description': rows['description'],
+        'currency': rows['currency'].astype(object)
+    })
+
+def unmatched_processor_frame(result, start=0, stop=None):
+    """Unmatched processor rows in report layout, optionally only positions start:stop of them"""
+    positions = np.flatnonzero(~result['processor_matched'])[start:stop]
+    rows = result['processor_data'].iloc[positions]
+    return pd.DataFrame({
+        'reference': rows['reference_number'],
+        'amount': rows['amount'],
+        'processor': rows['processor_name'].astype(object),
+        'description': rows['description'],
+        'currency': rows['currency'].astype(object)
+    })
+
+# Result sets served page by page: name -> (row count, slice in report layout)
+RESULT_SETS = {
+    'matches': (
+        lambda result: len(result['matches']),
+        lambda result, start, stop: result['matches'].iloc[start:stop]
+    ),
+    'unmatched_internal': (
+        lambda result: result['summary']['unmatched_internal_count'],
+        unmatched_internal_frame
+    ),
+    'unmatched_processor': (
+        lambda result: result['summary']['unmatched_processor_count'],
+        unmatched_processor_frame
+    ),
+    'leftover_matches': (
+        lambda result: len(result.get('leftover_matches', ())),
+        lambda result, start, stop: result.get('leftover_matches', EMPTY_LEFTOVER_MATCHES).iloc[start:stop]
+    ),
+    'duplicate_groups': (
+        lambda result: len(duplicate_groups_frame(result)),
+        lambda result, start, stop: duplicate_groups_frame(result).iloc[start:stop]
+    ),
+    'carried_matches': (
+        lambda result: len(result.get('carried_matches', ())),
+        lambda result, start, stop: result.get('carried_matches', EMPTY_CARRIED_MATCHES).iloc[start:stop]
+    )
+}
+PAGE_SIZE = int(os.environ.get('RECON_PAGE_SIZE', 1000))
+MAX_PAGE_SIZE = int(os.environ.get('RECON_MAX_PAGE_SIZE', 10000))
+
+def encode_cursor(version, offset):
+    """Cursor for a position in a result set, tied to the slot's dataset version"""
+    return f'{version[0]}.{version[1]}.{offset}'
+
+def decode_cursor(cursor, version):
+    """Offset encoded in a cursor; raises ValueError if malformed or issued for other data"""
+    internal_version, processor_version, offset = (int(part) for part in cursor.split('.'))
+    if (internal_version, processor_version) != tuple(version):
+        raise ValueError('Cursor was issued for data that has since changed; restart from the first page')
+    if offset < 0:
+        raise ValueError('Invalid cursor')
+    return offset
+
+# Result sets built on first use; their counts are left out of result_set_links until then
+LAZY_RESULT_SETS = {'duplicate_groups'}
+
+def result_set_links(module, currency, engine, result):
+    """Row counts and first-page URLs of each result set; the count of a lazy set not yet built is None"""
+    return {
+        name: {
+            'count': None if name in LAZY_RESULT_SETS and name not in result else count(result),
+            'url': f'/reconcile/results/{name}?module={module}&currency={currency}&engine={engine}'
+        }
+        for name, (count, _) in RESULT_SETS.items()
+    }
+
+# CSV downloads, streamed from the result frames in chunks
+CSV_REPORTS = {
+    'matched': 'matches',
+    'unmatched_internal': 'unmatched_internal',
+    'unmatched_processor': 'unmatched_processor',
+    'duplicate_groups': 'duplicate_groups',
+    'leftover_matches': 'leftover_matches',
+    'carried_matches': 'carried_matches'
+}
+REPORT_CHUNK_ROWS = int(os.environ.get('RECON_REPORT_CHUNK_ROWS', 50000))
+
+def csv_report_chunks(result, result_set, compress=False):
+    """Yield a result set as CSV bytes one chunk at a time, as a gzip stream when compress is set"""
+    count, rows = RESULT_SETS[result_set]
+    total = count(result)
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    # One pass even when empty so the header is always written
+    for start in range(0, max(total, 1), REPORT_CHUNK_ROWS):
+        chunk = rows(result, start, start + REPORT_CHUNK_ROWS).to_csv(index=False, header=start == 0).encode('utf-8')
+        yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
+
+def ndjson_rows(result, result_set, offset):
+    """Lazily serialize a result set from offset as newline-delimited JSON, one page at a time"""
+    count, rows = RESULT_SETS[result_set]
+    total = count(result)
+    for start in range(offset, total, PAGE_SIZE):
+        page = frame_to_records(rows(result, start, start + PAGE_SIZE))
+        yield ''.join(json.dumps(record) + '\n' for record in page)
+
+DUPLICATE_GROUP_COLUMNS = [
+    'reference', 'internal_count', 'processor_count', 'matched_pairs',
+    'internal_unmatched', 'processor_unmatched', 'internal_value', 'processor_value'
+]
+
+def duplicate_groups_frame(result):
+    """References occurring more than once on either side, with counts and values; built once per result.
+
+    Groups come from the reference codes of the hashes kept at ingest, so
+    only the duplicated references' strings are looked at.
+    """
+    if 'duplicate_groups' in result:
+        return result['duplicate_groups']
+    
+    internal_df = result['internal']
+    processor_df = result['processor_data']
+    n_internal = len(internal_df)
+    internal_codes, processor_codes = reference_codes(internal_df, processor_df)
+    codes = np.concatenate([internal_codes, processor_codes])
+    size = int(codes.max()) + 1 if len(codes) else 0
+    
+    def per_group(side_codes, weights=None):
+        return np.bincount(side_codes, weights=weights, minlength=size)
+    
+    internal_count = per_group(internal_codes)
+    processor_count = per_group(processor_codes)
+    groups = np.flatnonzero((internal_count > 1) | (processor_count > 1))
+    group_rows = first_code_rows(codes)[groups]
+    from_internal = group_rows < n_internal
+    references = np.empty(len(groups), dtype=object)
+    references[from_internal] = internal_df['reference_number'].to_numpy(dtype=object)[group_rows[from_internal]]
+    references[~from_internal] = \
+        processor_df['reference_number'].to_numpy(dtype=object)[group_rows[~from_internal] - n_internal]
+    matched_groups = pd.Index(references).get_indexer(result['matches']['reference'].to_numpy(dtype=object))
+    frame = pd.DataFrame({
+        'reference': references,
+        'internal_count': internal_count[groups],
+        'processor_count': processor_count[groups],
+        'matched_pairs': np.bincount(matched_groups[matched_groups >= 0], minlength=len(groups)),
+        'internal_unmatched': per_group(internal_codes, ~result['internal_matched'])[groups].astype(np.int64),
+        'processor_unmatched': per_group(processor_codes, ~result['processor_matched'])[groups].astype(np.int64),
+        'internal_value': per_group(internal_codes, np.nan_to_num(internal_df['amount'].to_numpy()))[groups],
+        'processor_value': per_group(processor_codes, np.nan_to_num(processor_df['amount'].to_numpy()))[groups]
+    }, columns=DUPLICATE_GROUP_COLUMNS)
+    result['duplicate_groups'] = frame
+    return frame
+
+# Stored columns kept out of report sheets
+INTERNAL_COLUMNS = ['amount_minor', 'reference_hash', 'reference_check']
+
+# Match_Status labels indexed by the matched mask
+MATCH_STATUS_LABELS = ['UNMATCHED', 'MATCHED']
+
+def with_match_status(df, matched):
+    """Report frame with a Match_Status column taken from a row-aligned matched mask, without copying df"""
+    columns = {column: df[column] for column in df.columns if column not in INTERNAL_COLUMNS}
+    columns['Match_Status'] = pd.Categorical.from_codes(matched.astype(np.int8), MATCH_STATUS_LABELS)
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+# Incremental reconciliation: per-slot reference index and matched state kept between runs. The
+# index lives in each worker process; the processor row count already reported lives in storage, so
+# under several gunicorn workers a delta covers the rows added since the last run on any of them.
+# That cursor only moves once a run's delta has been delivered, so a failed run reports its rows again
+incremental_state = {}
+incremental_lock = threading.Lock()
+
+def new_incremental_state(slot):
+    """Index the internal dataset by reference for matching processor rows batch by batch"""
+    internal_df = slot['internal']
+    references = internal_df['reference_number'].to_numpy(dtype=object)
+    codes, keys = pd.factorize(references)
+    internal_values, internal_amounts, internal_valid = dataset_amounts(internal_df)
+    internal_valid &= references != ''
+    
+    # The last internal row per reference is the one processor rows are matched against
+    winner = np.full(len(keys), -1, dtype=np.int64)
+    np.maximum.at(winner, codes, np.arange(len(internal_df), dtype=np.int64))
+    
+    return {
+        'internal_version': slot['version'][0],
+        'key_index': pd.Index(keys),
+        'internal_codes': codes,
+        'winner': winner,
+        'internal_values': internal_values,
+        'internal_amounts': internal_amounts,
+        'internal_valid': internal_valid,
+        'tolerance': amount_tolerance(internal_df),
+        'matched_keys': np.zeros(len(keys), dtype=bool),
+        'processor_codes': np.empty(0, dtype=np.int64),
+        'matches': pd.DataFrame(columns=MATCH_COLUMNS)
+    }
+
+def advance_incremental_state(state, slot, stop=None):
+    """Match processor rows added since the last run, up to row stop, against still-unmatched internal references"""
+    internal_df = slot['internal']
+    new_rows = slot['processor_data'].iloc[len(state['processor_codes']):stop]
+    
+    positions = state['key_index'].get_indexer(new_rows['reference_number'].to_numpy(dtype=object))
+    processor_values, processor_amounts, processor_valid = dataset_amounts(new_rows)
+    processor_valid &= new_rows['reference_number'].to_numpy(dtype=object) != ''
+    state['processor_codes'] = np.concatenate([state['processor_codes'], positions])
+    
+    # Candidates: known reference, not matched in an earlier run, within tolerance
+    rows = np.flatnonzero((positions >= 0) & processor_valid)
+    rows = rows[~state['matched_keys'][positions[rows]]]
+    internal_rows = state['winner'][positions[rows]]
+    within = state['internal_valid'][internal_rows] & (
+        np.abs(processor_amounts[rows] - state['internal_amounts'][internal_rows]) <= state['tolerance']
+    )
+    rows = rows[within]
+    
+    # First qualifying processor row per reference; key positions follow first appearance in the internal data
+    matched_positions, first = np.unique(positions[rows], return_index=True)
+    rows = rows[first]
+    internal_rows = state['winner'][matched_positions]
+    state['matched_keys'][matched_positions] = True
+    
+    new_matches = pd.DataFrame({
+        'reference': state['key_index'].to_numpy(dtype=object)[matched_positions],
+        'internal_amount': state['internal_values'][internal_rows],
+        'processor_amount': processor_values[rows],
+        'processor': new_rows['processor_name'].to_numpy(dtype=object)[rows],
+        'match_type': np.where(state['internal_amounts'][internal_rows] == processor_amounts[rows], 'exact', 'within_tolerance'),
+        'currency': internal_df['currency'].to_numpy(dtype=object)[internal_rows]
+    }, columns=MATCH_COLUMNS)
+    state['matches'] = new_matches if len(state['matches']) == 0 else pd.concat([state['matches'], new_matches], ignore_index=True)
+    return new_rows, new_matches
+
+def get_incremental_reconciliation(module, currency, progress=None):
+    """Reconcile only the processor rows added since the previous incremental run.
+
+    Returns (result, delta). The state is rebuilt from scratch when the
+    internal report was replaced or it ran ahead of the rows reported so
+    far, and catches up without reporting on rows another worker already
+    reported. Matches from later batches are appended after earlier ones;
+    counts, values and matched masks equal a full run without leftover
+    passes or carry-forward. The delta counts as reported only once
+    commit_incremental_delta is called for the result.
+    """
+    progress = progress or no_progress
+    progress('loading')
+    slot = storage.get_slot(module, currency)
+    with incremental_lock:
+        reported = min(storage.incremental_cursor(module, currency, slot['version'][0]), len(slot['processor_data']))
+        state = incremental_state.get((module, currency))
+        if state is None or state['internal_version'] != slot['version'][0] \
+                or len(state['processor_codes']) > reported:
+            state = new_incremental_state(slot)
+            incremental_state[(module, currency)] = state
+        if reported > len(state['processor_codes']):
+            advance_incremental_state(state, slot, reported)
+        
+        internal_before = int(state['matched_keys'][state['internal_codes']].sum())
+        progress('matching', internal_rows=len(slot['internal']),
+                 processor_rows=len(slot['processor_data']) - len(state['processor_codes']))
+        new_rows, new_matches = advance_incremental_state(state, slot)
+        progress('aggregating', rows_matched=len(state['matches']))
+        
+        internal_matched = state['matched_keys'][state['internal_codes']]
+        processor_codes = state['processor_codes']
+        processor_matched = (processor_codes >= 0) & state['matched_keys'][np.maximum(processor_codes, 0)]
+        result = build_result(slot, 'vectorized', state['matches'], internal_matched, processor_matched)
+    
+    new_processor_matched = processor_matched[len(processor_matched) - len(new_rows):]
+    delta = {
+        'processor_rows_added': len(new_rows),
+        'matched_count': len(new_matches),
+        'matched_value': float(new_matches['internal_amount'].sum()),
+        'internal_newly_matched': int(internal_matched.sum()) - internal_before,
+        'processor_rows_unmatched': int((~new_processor_matched).sum()),
+        'matches': frame_to_records(new_matches)
+    }
+    
+    # Full runs add leftover passes and carry-forward, so the result only stands in for one without them
+    if not LEFTOVER_PASSES and open_items is None:
+        cache_reconciliation((module, currency, 'vectorized'), result)
+    return result, delta
+
+def commit_incremental_delta(module, currency, result):
+    """Mark the processor rows of an incremental result as reported, once its delta has been delivered"""
+    storage.advance_incremental_cursor(module, currency, result['version'][0], result['summary']['total_processor'])
+
+# Per-phase timing and Prometheus-style metrics; counters are per process (each gunicorn worker reports its own)
+METRICS_ENABLED = os.environ.get('RECON_METRICS', '1') == '1'
+
+class PhaseTimer:
+    """Wall-clock seconds per phase of one operation; callable as a progress callback.
+
+    Each call closes the running phase and starts the named one, so time spent
+    re-entering a phase accumulates. Calls are forwarded to the wrapped
+    progress callback, which keeps job phases and counters up to date.
+    """
+
+    def __init__(self, operation, progress=None):
+        self.operation = operation
+        self.progress = progress or no_progress
+        self.phases = {}
+        self.phase = None
+        self.started = self.mark = time.perf_counter()
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def __call__(self, phase, **counters):
+        self.stop()
+        self.phase = phase
+        self.progress(phase, **counters)
+
+    def stop(self):
+        """Close the running phase"""
+        now = time.perf_counter()
+        if self.phase is not None:
+            self.phases[self.phase] = self.phases.get(self.phase, 0.0) + now - self.mark
+        self.phase = None
+        self.mark = now
+
+    def merge(self, phases):
+        """Add phase seconds timed by another timer, e.g. one slot of a batch"""
+        for phase, seconds in phases.items():
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def timings(self):
+        """Timings block for history entries, including the phase still running"""
+        phases = dict(self.phases)
+        now = time.perf_counter()
+        if self.phase is not None:
+            phases[self.phase] = phases.get(self.phase, 0.0) + now - self.mark
+        return {
+            'total_seconds': round(now - self.started, 6),
+            'phases': {phase: round(seconds, 6) for phase, seconds in phases.items()}
+        }
+
+METRIC_TYPES = {
+    'recon_requests_total': ('counter', 'Requests by operation and HTTP status'),
+    'recon_request_seconds_total': ('counter', 'Wall-clock seconds spent per operation'),
+    'recon_phase_seconds_total': ('counter', 'Wall-clock seconds spent per operation phase'),
+    'recon_rows_total': ('counter', 'Rows ingested, reconciled or exported per operation'),
+    'recon_bytes_in_total': ('counter', 'Request body bytes received per operation'),
+    'recon_bytes_out_total': ('counter', 'Response body bytes sent per operation')
+}
+
+class Metrics:
+    """Counters keyed by (metric, labels), rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = OrderedDict()
+
+    def add(self, metric, labels, value):
+        key = (metric, tuple(labels.items()))
+        self.values[key] = self.values.get(key, 0) + value
+
+    def record(self, timer, status):
+        """Add a finished operation's timings, rows and bytes"""
+        if not METRICS_ENABLED:
+            return
+        timer.stop()
+        operation = {'operation': timer.operation}
+        with self.lock:
+            self.add('recon_requests_total', dict(operation, status=str(status)), 1)
+            self.add('recon_request_seconds_total', operation, timer.mark - timer.started)
+            for phase, seconds in timer.phases.items():
+                self.add('recon_phase_seconds_total', dict(operation, phase=phase), seconds)
+            self.add('recon_rows_total', operation, timer.rows)
+            self.add('recon_bytes_in_total', operation, timer.bytes_in)
+            self.add('recon_bytes_out_total', operation, timer.bytes_out)
+
+    def render(self):
+        with self.lock:
+            values = list(self.values.items())
+        lines = []
+        for metric, (metric_type, description) in METRIC_TYPES.items():
+            lines += [f'# HELP {metric} {description}', f'# TYPE {metric} {metric_type}']
+            for (name, labels), value in values:
+                if name == metric:
+                    label_text = ','.join(f'{label}="{text}"' for label, text in labels)
+                    lines.append(f'{metric}{{{label_text}}} {value:.6g}')
+        return '\n'.join(lines) + '\n'
+
+metrics = Metrics()
+
+def metered_body(body, timer, status):
+    """Pass a streamed response body through, counting bytes; records the timer once it is sent"""
+    try:
+        for chunk in body:
+            timer.bytes_out += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+        metrics.record(timer, status)
+
+# On-demand profiling of single requests: pass ?profile=1 with the admin token
+PROFILE_DIR = os.path.join(DATA_DIR, 'profiles')
+PROFILE_RETENTION = int(os.environ.get('RECON_PROFILE_RETENTION', 20))
+PROFILE_TOP = 30
+PROFILE_ID = re.compile(r'^[\w-]+$')
+# Functions whose cumulative time is reported on their own: matching, aggregation and serialization
+PROFILE_FOCUS = [
+    'find_matches_optimized', 'match_frames', 'join_columns', 'match_columns_one_to_one',
+    'match_columns_partitioned', 'apply_leftover_passes', 'build_result', 'build_dataset',
+    'frame_to_records', 'jsonify', 'csv_report_chunks', 'add_frame'
+]
+# tracemalloc is process-wide, so only one request is profiled at a time
+profile_lock = threading.Lock()
+
+def admin_error():
+    """Error response unless the request carries the admin token"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Admin access is disabled'}), 404
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_TOKEN):
+        return jsonify({'error': 'Admin token required'}), 403
+    return None
+
+def profiled_response(timer, view, args, kwargs):
+    """Run a view under cProfile and tracemalloc and save the artifact; streamed bodies are built inside the profile"""
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    try:
+        profiler.enable()
+        try:
+            response = app.make_response(view(*args, **kwargs))
+            if response.is_streamed and not response.direct_passthrough:
+                response.set_data(response.get_data())
+        finally:
+            profiler.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    
+    response.headers['X-Profile-Id'] = save_profile(timer, profiler, peak, snapshot)
+    return response
+
+def save_profile(timer, profiler, peak, snapshot):
+    """Write the pstats dump and a JSON report for one profiled request; returns the profile id"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{timer.operation}-{uuid.uuid4().hex[:8]}"
+    stats = pstats.Stats(profiler)
+    stats.dump_stats(os.path.join(PROFILE_DIR, f'{profile_id}.pstats'))
+    
+    entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+    focus = {}
+    for (_, _, function), (_, _, _, cumulative, _) in entries:
+        if function in PROFILE_FOCUS:
+            focus[function] = round(focus.get(function, 0.0) + cumulative, 6)
+    allocations = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)]).statistics('lineno')
+    
+    report = {
+        'profile_id': profile_id,
+        'operation': timer.operation,
+        'path': request.full_path,
+        'created': datetime.now().isoformat(),
+        'timings': timer.timings(),
+        'focus_cumulative_seconds': focus,
+        'top_functions': [{
+            'function': f'{os.path.basename(filename)}:{line}({function})',
+            'calls': calls,
+            'self_seconds': round(own, 6),
+            'cumulative_seconds': round(cumulative, 6)
+        } for (filename, line, function), (_, calls, own, cumulative, _) in entries[:PROFILE_TOP]],
+        'peak_allocated_bytes': peak,
+        'top_allocations': [{
+            'location': f'{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}',
+            'size_bytes': stat.size,
+            'blocks': stat.count
+        } for stat in allocations[:PROFILE_TOP]]
+    }
+    with open(os.path.join(PROFILE_DIR, f'{profile_id}.json'), 'w') as handle:
+        json.dump(report, handle, indent=2)
+    
+    # Keep the newest PROFILE_RETENTION profiles
+    reports = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for name in reports[:max(len(reports) - PROFILE_RETENTION, 0)]:
+        for suffix in ('.json', '.pstats'):
+            path = os.path.join(PROFILE_DIR, name[:-len('.json')] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
+    return profile_id
+
+def instrumented(operation):
+    """Route decorator: times the view through g.timer and records it with request and response sizes.
+
+    With ?profile=1 and the admin token the call also runs under the profiler.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            timer = g.timer = PhaseTimer(operation)
+            timer.bytes_in = request.content_length or 0
+            if request.args.get('profile') in ('1', 'true'):
+                error = admin_error()
+                if error:
+                    return error
+                if not profile_lock.acquire(blocking=False):
+                    return jsonify({'error': 'Another request is being profiled'}), 409
+                try:
+                    response = profiled_response(timer, view, args, kwargs)
+                finally:
+                    profile_lock.release()
+            else:
+                response = app.make_response(view(*args, **kwargs))
+            if response.is_streamed and not response.direct_passthrough:
+                timer('streaming')
+                response.response = metered_body(response.response, timer, response.status_code)
+            else:
+                timer.bytes_out = response.content_length or timer.bytes_out
+                metrics.record(timer, response.status_code)
+            return response
+        return wrapper
+    return decorator
+
+# Reconcile requests, shared by the synchronous route and background jobs
+def no_progress(phase, **counters):
+    """Default progress callback"""
+
+def reconcile_options(data):
+    """Validate a reconcile request body; returns (options, error)"""
+    data = data or {}
+    module = data.get('module')
+    currency = data.get('currency')
+    
+    if not module or not currency:
+        return None, 'Module and currency are required'
+    
+    engine = data.get('engine', MATCH_ENGINE)
+    error = validate_selection(module, currency, engine)
+    if error:
+        return None, error
+    
+    incremental = bool(data.get('incremental', False))
+    if incremental and engine != 'vectorized':
+        return None, 'Incremental reconciliation requires the vectorized engine'
+    
+    return {
+        'module': module,
+        'currency': currency,
+        'engine': engine,
+        'incremental': incremental,
+        'include_rows': bool(data.get('include_rows', False))
+    }, None
+
+def history_entry(module, currency, summary, timings=None):
+    """Reconciliation history record for one slot's summary and the phase timings of its run"""
+    return {
+        'module': module,
+        'currency': currency,
+        'timestamp': datetime.now().isoformat(),
+        'matched_count': summary['matched_count'],
+        'unmatched_internal_count': summary['unmatched_internal_count'],
+        'unmatched_processor_count': summary['unmatched_processor_count'],
+        'matched_value': summary['matched_value'],
+        'unmatched_internal_value': summary['unmatched_internal_value'],
+        'unmatched_processor_value': summary['unmatched_processor_value'],
+        'timings': timings
+    }
+
+def reconcile_slot(module, currency, engine, incremental, include_rows=False, progress=no_progress, deliver=None):
+    """Reconcile one slot, record it in history and build the response payload.
+
+    Rows are left out unless include_rows is set; clients page through them
+    with the result set URLs instead. progress may be a PhaseTimer; the
+    history entry gets its timings up to the built payload. deliver, when
+    given, stores the payload; an incremental delta is committed only after
+    it returns, so a run that fails on the way reports its rows again.
+    """
+    timer = progress if isinstance(progress, PhaseTimer) else PhaseTimer('reconcile', progress)
+    delta = None
+    if incremental:
+        result, delta = get_incremental_reconciliation(module, currency, timer)
+    else:
+        result = get_reconciliation(module, currency, engine, timer, record=True)
+    summary = result['summary']
+    timer.rows = summary['total_internal'] + summary['total_processor']
+    
+    timer('serializing', rows_matched=summary['matched_count'])
+    payload = reconcile_payload(module, currency, engine, include_rows, result, delta)
     
-    total_matched = 0
-    total_unmatched_internal = 0
-    total_unmatched_processor = 0
+    # Add to reconciliation history
+    storage.add_history(history_entry(module, currency, summary, timer.timings()))
+    if deliver is not None:
+        deliver(payload)
+    if incremental:
+        commit_incremental_delta(module, currency, result)
+    return payload
+
+def reconcile_payload(module, currency, engine, include_rows, result, delta=None):
+    """Response body for a reconciled slot; delta is set for incremental runs"""
+    summary = result['summary']
+    if delta is not None:
+        return {
+            'mode': 'incremental',
+            'delta': delta,
+            'unmatched_breakdown': result['unmatched_breakdown'],
+            'summary': summary
+        }
     
-    for recon in reconciliation_history:
-        total_matched += recon.get('matched_count', 0)
-        total_unmatched_internal += recon.get('unmatched_internal_count', 0)
-        total_unmatched_processor += recon.get('unmatched_processor_count', 0)
+    if not include_rows:
+        return {
+            'result_sets': result_set_links(module, currency, engine, result),
+            'unmatched_breakdown': result['unmatched_breakdown'],
+            'summary': summary
+        }
     
     return {
-        'total_reconciliations': total_reconciliations,
-        'total_matched': total_matched,
-        'total_unmatched_internal': total_unmatched_internal,
-        'total_unmatched_processor': total_unmatched_processor
+        'matches': frame_to_records(result['matches']),
+        'unmatched_internal': frame_to_records(unmatched_internal_frame(result)),
+        'unmatched_processor': frame_to_records(unmatched_processor_frame(result)),
+        'unmatched_breakdown': result['unmatched_breakdown'],
+        'summary': summary
     }
 
+# Batch reconciliation of many slots
+def reconcile_batch(slots, engine):
+    """Reconcile (module, currency) slots in turn, reusing results cached for the current data.
+
+    Slots match in this process: pickling the frames to pool workers and
+    the matches back cost more than the matching itself. New results go
+    into the result cache, so later /reconcile and download requests reuse
+    them; a partitioned engine still spreads each match over the pool.
+    """
+    results = []
+    for module, currency in slots:
+        timer = PhaseTimer('reconcile_batch')
+        result = get_reconciliation(module, currency, engine, timer, record=True)
+        timer.stop()
+        results.append({
+            'module': module,
+            'currency': currency,
+            'summary': result['summary'],
+            'unmatched_breakdown': result['unmatched_breakdown'],
+            'timings': timer.timings()
+        })
+    return results
+
+# Background reconciliation jobs; job records live in SQLite storage so any worker can answer a poll
+JOB_WORKERS = int(os.environ.get('RECON_JOB_WORKERS', 2))
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix='reconcile-job')
+
+def submit_reconcile_job(options):
+    """Queue a reconciliation on the job executor and return the new job record"""
+    now = datetime.now().isoformat()
+    job = {
+        'job_id': uuid.uuid4().hex,
+        'status': 'queued',
+        'phase': 'queued',
+        'progress': {},
+        'error': None,
+        'created': now,
+        'updated': now,
+        **options
+    }
+    storage.save_job(job)
+    job_executor.submit(run_reconcile_job, dict(job))
+    return job
+
+def run_reconcile_job(job):
+    """Run a queued job, saving phase and progress counters as it goes"""
+    def progress(phase, **counters):
+        job['phase'] = phase
+        job['progress'].update(counters)
+        job['updated'] = datetime.now().isoformat()
+        storage.save_job(job)
+    
+    job['status'] = 'running'
+    timer = PhaseTimer('reconcile_job', progress)
+    try:
+        reconcile_slot(
+            job['module'], job['currency'], job['engine'], job['incremental'], job['include_rows'], timer,
+            deliver=lambda payload: storage.save_job_result(job['job_id'], payload)
+        )
+        job['status'] = 'done'
+        metrics.record(timer, job['status'])
+        progress('done')
+    except Exception as e:
+        job['status'] = 'failed'
+        job['error'] = f'Reconciliation failed: {str(e)}'
+        metrics.record(timer, job['status'])
+        progress('failed')
+
 # HTML for the landing page
 LANDING_HTML = '''
 <!DOCTYPE html>
@@ -800,16 +3622,44 @@ LANDING_HTML = '''
             resultsDiv.innerHTML = '<div style="text-align: center; padding: 30px;"><i class="fas fa-cog fa-spin" style="font-size: 2rem; color: var(--primary);"></i><h3 style="margin: 15px 0;">Processing Reconciliation...</h3></div>';
             
             try {
-                const response = await fetch('/reconcile', {
+                const request = {
                     method: 'POST',
                     headers: {'Content-Type': 'application/json'},
                     body: JSON.stringify({
                         module: currentModule,
                         currency: currentCurrency
                     })
-                });
-                const data = await response.json();
+                };
+                const response = await fetch('/reconcile/jobs', request);
+                
+                // Servers that cannot share job records across workers refuse background jobs: run inline
+                if (response.status === 409) {
+                    const data = await (await fetch('/reconcile', request)).json();
+                    if (data.error) throw new Error(data.error);
+                    displayResults(data);
+                    updateOverallStats();
+                    return;
+                }
+                let job = await response.json();
+                
+                if (job.error) throw new Error(job.error);
                 
+                // Poll the job until it finishes, showing the current phase
+                while (job.status === 'queued' || job.status === 'running') {
+                    await new Promise(resolve => setTimeout(resolve, 500));
+                    const poll = await fetch(job.status_url || '/reconcile/jobs/' + job.job_id);
+                    if (poll.status === 404) {
+                        throw new Error('The server no longer knows this reconciliation job (it may have restarted). Please run it again.');
+                    }
+                    job = await poll.json();
+                    if (job.error && job.status !== 'failed') throw new Error(job.error);
+                    const matched = job.progress && job.progress.rows_matched !== undefined
+                        ? ` (${job.progress.rows_matched.toLocaleString()} matched)` : '';
+                    resultsDiv.querySelector('h3').textContent = `Processing Reconciliation: ${job.phase}${matched}...`;
+                }
+                if (job.status === 'failed') throw new Error(job.error);
+                
+                const data = await (await fetch('/reconcile/jobs/' + job.job_id + '/result')).json();
                 if (data.error) throw new Error(data.error);
                 
                 displayResults(data);
@@ -957,7 +3807,81 @@ def overall_stats():
     stats = get_overall_statistics()
     return jsonify({'stats': stats})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Per-phase timings, rows and bytes for upload, reconcile, batch and download in the Prometheus text format"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/profiles')
+def list_profiles():
+    """Saved profiles, newest first"""
+    error = admin_error()
+    if error:
+        return error
+    names = sorted(os.listdir(PROFILE_DIR), reverse=True) if os.path.isdir(PROFILE_DIR) else []
+    return jsonify({'profiles': [
+        {'profile_id': profile_id, 'report_url': f'/admin/profiles/{profile_id}'}
+        for profile_id in (name[:-len('.json')] for name in names if name.endswith('.json'))
+    ]})
+
+@app.route('/admin/profiles/<profile_id>')
+def get_profile(profile_id):
+    """JSON report of a saved profile, or the raw pstats dump with format=pstats"""
+    error = admin_error()
+    if error:
+        return error
+    if not PROFILE_ID.match(profile_id):
+        return jsonify({'error': 'Unknown profile'}), 404
+    
+    if request.args.get('format') == 'pstats':
+        path = os.path.join(PROFILE_DIR, f'{profile_id}.pstats')
+        if not os.path.exists(path):
+            return jsonify({'error': 'Unknown profile'}), 404
+        return send_file(os.path.abspath(path), mimetype='application/octet-stream',
+                         as_attachment=True, download_name=f'{profile_id}.pstats')
+    
+    path = os.path.join(PROFILE_DIR, f'{profile_id}.json')
+    if not os.path.exists(path):
+        return jsonify({'error': 'Unknown profile'}), 404
+    with open(path) as handle:
+        return jsonify(json.load(handle))
+
+@app.route('/history')
+def history():
+    """Reconciliation history, newest first, filtered by module, currency and date range and paged by cursor"""
+    try:
+        module = request.args.get('module')
+        currency = request.args.get('currency')
+        if (module and module not in MODULES) or (currency and currency not in CURRENCIES):
+            return jsonify({'error': 'Unknown module or currency'}), 400
+        
+        # since is inclusive; a date-only until covers that whole day
+        try:
+            since = request.args.get('since')
+            since = datetime.fromisoformat(since).isoformat() if since else None
+            until = request.args.get('until')
+            if until:
+                until_date = datetime.fromisoformat(until)
+                until = (until_date + timedelta(days=1) if len(until) == 10 else until_date).isoformat()
+            cursor = request.args.get('cursor')
+            before_id = int(cursor) if cursor else None
+            limit = max(min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE), 1)
+        except ValueError:
+            return jsonify({'error': 'Invalid date range, cursor or limit'}), 400
+        
+        entries = storage.query_history(limit, module or None, currency or None, since, until, before_id)
+        return jsonify({
+            'entries': entries,
+            'next_cursor': str(entries[-1]['id']) if len(entries) == limit else None
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Could not load history: {str(e)}'}), 500
+
 @app.route('/upload/<file_type>', methods=['POST'])
+@instrumented('upload')
 def upload_file(file_type):
     """Handle file uploads for internal and processor reports"""
     try:
@@ -967,6 +3891,9 @@ def upload_file(file_type):
         if not module or not currency:
             return jsonify({'error': 'Module and currency are required'}), 400
         
+        if module not in MODULES or currency not in CURRENCIES:
+            return jsonify({'error': 'Unknown module or currency'}), 400
+        
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
         
@@ -974,151 +3901,232 @@ def upload_file(file_type):
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Read file
-        if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
+        if file_type not in ('internal', 'processor'):
+            return jsonify({'error': 'Invalid file type'}), 400
+        
+        processor_name = request.form.get('processor_name', 'unknown') if file_type == 'processor' else None
+        
+        # openpyxl cannot open legacy .xls workbooks and the streaming reader only reads .xlsx, so .xls
+        # always goes through pandas
+        excel_reader = request.form.get('excel_reader', EXCEL_READER if file.filename.endswith('.xlsx') else 'pandas')
+        if excel_reader not in EXCEL_READERS:
+            return jsonify({'error': f"excel_reader must be one of: {', '.join(EXCEL_READERS)}"}), 400
+        if excel_reader == 'streaming' and file.filename.endswith('.xls'):
+            return jsonify({'error': 'The streaming Excel reader only reads .xlsx files; use excel_reader=pandas'}), 400
+        
+        # Read file; CSV uploads are parsed from the request stream in fixed-size batches
+        started = time.perf_counter()
+        snapshot = stored = None
+        if SNAPSHOTS_ENABLED and file.filename.endswith(('.csv', '.xlsx', '.xls')):
+            g.timer('hashing')
+            snapshot = snapshot_key(
+                file.stream, currency, CURRENCY_DECIMALS.get(currency, 2), processor_name,
+                os.path.splitext(file.filename)[1], excel_reader
+            )
+            stored = load_snapshot(snapshot)
+        g.timer('parsing')
+        if stored is not None:
+            batches, reader = [], 'snapshot'
+        elif file.filename.endswith('.csv'):
+            batches = read_csv_batches(file.stream)
+            reader = 'csv'
         elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
+            batches, reader = read_excel_cached(file.read(), excel_reader)
         else:
             return jsonify({'error': 'File must be CSV or Excel'}), 400
         
-        if 'reference_number' not in df.columns or 'amount' not in df.columns:
-            return jsonify({'error': 'File must have reference_number and amount columns'}), 400
+        # Batches are parsed lazily, so parsing and normalizing alternate per batch
+        datasets = [] if stored is None else [stored]
+        for batch in batches:
+            if 'reference_number' not in batch.columns or 'amount' not in batch.columns:
+                return jsonify({'error': 'File must have reference_number and amount columns'}), 400
+            g.timer('normalizing')
+            datasets.append(build_dataset(batch[[c for c in INGEST_COLUMNS if c in batch.columns]], currency, processor_name))
+            g.timer('parsing')
+        if snapshot and stored is None and datasets:
+            g.timer('snapshotting')
+            datasets = [save_snapshot(snapshot, concat_datasets(datasets))]
+        row_count = sum(len(dataset) for dataset in datasets)
+        g.timer.rows = row_count
         
-        if 'description' not in df.columns:
-            df['description'] = ''
+        elapsed = time.perf_counter() - started
+        ingest = {
+            'reader': reader,
+            'rows': row_count,
+            'seconds': round(elapsed, 3),
+            'rows_per_sec': round(row_count / elapsed) if elapsed > 0 else None
+        }
+        app.logger.info('Ingested %s rows from %s via %s reader (%s rows/sec)',
+                        ingest['rows'], file.filename, reader, ingest['rows_per_sec'])
         
-        # Add currency to records
-        records = df.to_dict('records')
-        for record in records:
-            record['currency'] = currency
+        g.timer('storing')
         
         if file_type == 'internal':
-            reconciliation_data[module][currency]['internal'] = records
-            return jsonify({'message': f'Internal report loaded: {len(records):,} transactions'})
+            storage.set_internal(module, currency, datasets)
+            message = f'Internal report loaded: {row_count:,} transactions'
         
-        elif file_type == 'processor':
-            processor_name = request.form.get('processor_name', 'unknown')
-            
-            # Store in processor datasets
-            if processor_name not in reconciliation_data[module][currency]['processors']:
-                reconciliation_data[module][currency]['processors'][processor_name] = []
-            reconciliation_data[module][currency]['processors'][processor_name].extend(records)
-            
-            # Also add to combined processor data
-            for record in records:
-                record['processor_name'] = processor_name
-            reconciliation_data[module][currency]['processor_data'].extend(records)
-            
-            return jsonify({'message': f'{processor_name} data loaded: {len(records):,} transactions'})
+        else:
+            # Append to the combined processor dataset; processor_name is a categorical column
+            storage.append_processor(module, currency, datasets)
+            message = f'{processor_name} data loaded: {row_count:,} transactions'
+        invalidate_reconciliation(module, currency)
+        
+        # A new snapshot can push older ones past SNAPSHOT_RETENTION; those stored uploads reference are kept
+        if snapshot and stored is None:
+            prune_snapshots(storage.snapshot_references())
+        return jsonify({'message': message, 'ingest': ingest})
         
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
 @app.route('/reconcile', methods=['POST'])
+@instrumented('reconcile')
 def reconcile():
     """Run reconciliation for specific module and currency"""
     try:
-        data = request.get_json()
-        module = data.get('module')
-        currency = data.get('currency')
+        options, error = reconcile_options(request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
         
-        if not module or not currency:
-            return jsonify({'error': 'Module and currency are required'}), 400
+        return jsonify(reconcile_slot(**options, progress=g.timer))
         
-        internal_data = reconciliation_data[module][currency]['internal']
-        processor_data = reconciliation_data[module][currency]['processor_data']
-        processors = reconciliation_data[module][currency]['processors']
+    except Exception as e:
+        return jsonify({'error': f'Reconciliation failed: {str(e)}'}), 500
+
+@app.route('/reconcile/batch', methods=['POST'])
+@instrumented('reconcile_batch')
+def reconcile_batch_route():
+    """Reconcile several module/currency slots at once; defaults to every slot"""
+    try:
+        data = request.get_json(silent=True) or {}
+        engine = data.get('engine', MATCH_ENGINE)
+        requested = data.get('slots') or [
+            {'module': module, 'currency': currency} for module in MODULES for currency in CURRENCIES
+        ]
         
-        # Use optimized matching
-        matches, matched_references = find_matches_optimized(internal_data, processor_data)
+        slots = []
+        for selection in requested:
+            slot = (selection.get('module'), selection.get('currency'))
+            error = validate_selection(slot[0], slot[1], engine)
+            if error:
+                return jsonify({'error': f'{error}: {slot[0]}/{slot[1]}'}), 400
+            if slot not in slots:
+                slots.append(slot)
         
-        # Find unmatched transactions
-        unmatched_internal = [
-            {
-                'reference': internal['reference_number'],
-                'amount': float(internal['amount']),
-                'description': internal.get('description', ''),
-                'currency': internal.get('currency', '')
-            }
-            for internal in internal_data 
-            if internal['reference_number'] not in matched_references
-        ]
+        results = reconcile_batch(slots, engine)
         
-        unmatched_processor = [
-            {
-                'reference': processor['reference_number'],
-                'amount': float(processor['amount']),
-                'processor': processor['processor_name'],
-                'description': processor.get('description', ''),
-                'currency': processor.get('currency', '')
-            }
-            for processor in processor_data 
-            if processor['reference_number'] not in matched_references
-        ]
+        # Record history for slots that have data; the combined totals cover the same entries
+        entries = []
+        for result in results:
+            summary = result['summary']
+            g.timer.merge(result['timings']['phases'])
+            g.timer.rows += summary['total_internal'] + summary['total_processor']
+            if summary['total_internal'] or summary['total_processor']:
+                entries.append(history_entry(result['module'], result['currency'], summary, result['timings']))
+                storage.add_history(entries[-1])
         
-        # Calculate unmatched breakdown by processor
-        unmatched_breakdown = {'processors': {}}
-        for processor_name, processor_records in processors.items():
-            unmatched_count = sum(1 for record in processor_records if record['reference_number'] not in matched_references)
-            unmatched_value = sum(float(record['amount']) for record in processor_records if record['reference_number'] not in matched_references)
-            if unmatched_count > 0:
-                unmatched_breakdown['processors'][processor_name] = {
-                    'count': unmatched_count,
-                    'value': unmatched_value
-                }
+        return jsonify({
+            'slots': results,
+            'combined': combine_statistics(entries)
+        })
         
-        # Calculate comprehensive summary
-        total_internal = len(internal_data)
-        total_processor = len(processor_data)
-        total_internal_value = sum(float(internal['amount']) for internal in internal_data)
-        total_processor_value = sum(float(processor['amount']) for processor in processor_data)
-        matched_value = sum(match['internal_amount'] for match in matches)
-        unmatched_internal_value = sum(txn['amount'] for txn in unmatched_internal)
-        unmatched_processor_value = sum(txn['amount'] for txn in unmatched_processor)
-        unmatched_total = len(unmatched_internal) + len(unmatched_processor)
-        unmatched_total_value = unmatched_internal_value + unmatched_processor_value
+    except Exception as e:
+        return jsonify({'error': f'Batch reconciliation failed: {str(e)}'}), 500
+
+@app.route('/reconcile/results/<result_set>')
+def reconcile_results(result_set):
+    """One page of matches or unmatched rows, or the rest of the set as NDJSON with format=ndjson"""
+    try:
+        if result_set not in RESULT_SETS:
+            return jsonify({'error': 'Invalid result set'}), 400
         
-        summary = {
-            'total_internal': total_internal,
-            'total_processor': total_processor,
-            'total_internal_value': total_internal_value,
-            'total_processor_value': total_processor_value,
-            'matched_count': len(matches),
-            'matched_value': matched_value,
-            'unmatched_internal_count': len(unmatched_internal),
-            'unmatched_internal_value': unmatched_internal_value,
-            'unmatched_processor_count': len(unmatched_processor),
-            'unmatched_processor_value': unmatched_processor_value,
-            'unmatched_total': unmatched_total,
-            'unmatched_total_value': unmatched_total_value
-        }
+        module = request.args.get('module')
+        currency = request.args.get('currency')
+        engine = request.args.get('engine', MATCH_ENGINE)
+        if not module or not currency:
+            return jsonify({'error': 'Module and currency are required'}), 400
         
-        # Add to reconciliation history
-        reconciliation_history.append({
-            'module': module,
-            'currency': currency,
-            'timestamp': datetime.now().isoformat(),
-            'matched_count': len(matches),
-            'unmatched_internal_count': len(unmatched_internal),
-            'unmatched_processor_count': len(unmatched_processor),
-            'matched_value': matched_value,
-            'unmatched_internal_value': unmatched_internal_value,
-            'unmatched_processor_value': unmatched_processor_value
-        })
+        error = validate_selection(module, currency, engine)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        result = get_reconciliation(module, currency, engine)
+        try:
+            cursor = request.args.get('cursor')
+            offset = decode_cursor(cursor, result['version']) if cursor else 0
+            limit = min(int(request.args.get('limit', PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
+        if request.args.get('format') == 'ndjson':
+            return Response(ndjson_rows(result, result_set, offset), mimetype='application/x-ndjson')
+        
+        count, rows = RESULT_SETS[result_set]
+        total = count(result)
+        stop = min(offset + max(limit, 1), total)
         return jsonify({
-            'matches': matches,
-            'unmatched_internal': unmatched_internal,
-            'unmatched_processor': unmatched_processor,
-            'unmatched_breakdown': unmatched_breakdown,
-            'summary': summary
+            'result_set': result_set,
+            'total': total,
+            'offset': offset,
+            'rows': frame_to_records(rows(result, offset, stop)),
+            'next_cursor': encode_cursor(result['version'], stop) if stop < total else None
         })
         
     except Exception as e:
-        return jsonify({'error': f'Reconciliation failed: {str(e)}'}), 500
+        return jsonify({'error': f'Could not load results: {str(e)}'}), 500
+
+@app.route('/reconcile/jobs', methods=['POST'])
+def create_reconcile_job():
+    """Start a reconciliation in the background and return its job id.
+
+    Refused with 409 under the memory backend: its job records live in one
+    process, so with several workers (WEB_CONCURRENCY) or serverless
+    instances a poll can land where the job is unknown.
+    """
+    try:
+        if isinstance(storage, MemoryStorage):
+            return jsonify({
+                'error': 'Background jobs need the sqlite storage backend; use POST /reconcile',
+                'reconcile_url': '/reconcile'
+            }), 409
+        
+        options, error = reconcile_options(request.get_json())
+        if error:
+            return jsonify({'error': error}), 400
+        
+        job = submit_reconcile_job(options)
+        return jsonify({
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'status_url': f"/reconcile/jobs/{job['job_id']}",
+            'result_url': f"/reconcile/jobs/{job['job_id']}/result"
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': f'Could not start reconciliation: {str(e)}'}), 500
+
+@app.route('/reconcile/jobs/<job_id>')
+def reconcile_job_status(job_id):
+    """Status, phase and progress counters of a background reconciliation"""
+    job = storage.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/reconcile/jobs/<job_id>/result')
+def reconcile_job_result(job_id):
+    """Result payload of a finished background reconciliation"""
+    job = storage.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] == 'failed':
+        return jsonify({'error': job['error']}), 500
+    if job['status'] != 'done':
+        return jsonify({'error': 'Job has not finished', 'status': job['status'], 'phase': job['phase']}), 409
+    return jsonify(storage.get_job_result(job_id))
 
 @app.route('/download/<report_type>', methods=['POST'])
+@instrumented('download')
 def download_report(report_type):
     """Download reports for specific module and currency"""
     try:
@@ -1129,117 +4137,104 @@ def download_report(report_type):
         if not module or not currency:
             return jsonify({'error': 'Module and currency are required'}), 400
         
-        # Re-run reconciliation to get current data
-        recon_response = reconcile()
-        reconciliation_result = recon_response.get_json()
+        engine = data.get('engine', MATCH_ENGINE)
+        error = validate_selection(module, currency, engine)
+        if error:
+            return jsonify({'error': error}), 400
         
-        if 'error' in reconciliation_result:
-            return jsonify({'error': reconciliation_result['error']}), 500
+        # Reuse the cached result for the current uploads instead of re-running the match
+        result = get_reconciliation(module, currency, engine, g.timer)
+        internal_df = result['internal']
+        processor_df = result['processor_data']
+        g.timer('serializing')
         
-        internal_data = reconciliation_data[module][currency]['internal']
-        processors = reconciliation_data[module][currency]['processors']
-        
-        if report_type == 'matched':
-            df = pd.DataFrame(reconciliation_result['matches'])
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            output.seek(0)
-            return send_file(
-                io.BytesIO(output.getvalue().encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'{module}_{currency}_matched_{datetime.now().strftime("%Y%m%d")}.csv'
+        if report_type in CSV_REPORTS:
+            count, _ = RESULT_SETS[CSV_REPORTS[report_type]]
+            g.timer.rows = count(result)
+            compress = bool(data.get('gzip', False))
+            filename = f'{module}_{currency}_{report_type}_{datetime.now().strftime("%Y%m%d")}.csv'
+            if compress:
+                filename += '.gz'
+            return Response(
+                csv_report_chunks(result, CSV_REPORTS[report_type], compress),
+                mimetype='application/gzip' if compress else 'text/csv',
+                headers={'Content-Disposition': f'attachment; filename={filename}'}
             )
             
-        elif report_type == 'unmatched_internal':
-            df = pd.DataFrame(reconciliation_result['unmatched_internal'])
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            output.seek(0)
-            return send_file(
-                io.BytesIO(output.getvalue().encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'{module}_{currency}_unmatched_internal_{datetime.now().strftime("%Y%m%d")}.csv'
-            )
+        elif report_type == 'full_reconciliation':
+            # Create comprehensive Excel report in a per-request buffer that spills to disk when large
+            output = tempfile.SpooledTemporaryFile(max_size=EXCEL_SPOOL_BYTES)
+            writer = XlsxStreamWriter(output)
+            # Internal Report sheet
+            if len(internal_df) > 0:
+                writer.add_frame('Internal Report', with_match_status(internal_df, result['internal_matched']))
             
-        elif report_type == 'unmatched_processor':
-            df = pd.DataFrame(reconciliation_result['unmatched_processor'])
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            output.seek(0)
-            return send_file(
-                io.BytesIO(output.getvalue().encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f'{module}_{currency}_unmatched_processor_{datetime.now().strftime("%Y%m%d")}.csv'
-            )
+            # Processor Reports (separate sheets), sliced by row positions along with their matched masks
+            for processor_name, rows in processor_groups(processor_df).items():
+                processor_sheet = with_match_status(processor_df.iloc[rows], result['processor_matched'][rows])
+                writer.add_frame(processor_name, processor_sheet)
             
-        elif report_type == 'full_reconciliation':
-            # Create comprehensive Excel report
-            with pd.ExcelWriter('full_reconciliation.xlsx', engine='openpyxl') as writer:
-                # Internal Report sheet
-                if internal_data:
-                    internal_df = pd.DataFrame(internal_data)
-                    # Add match status
-                    matched_refs = [match['reference'] for match in reconciliation_result['matches']]
-                    internal_df['Match_Status'] = internal_df['reference_number'].isin(matched_refs).map({True: 'MATCHED', False: 'UNMATCHED'})
-                    internal_df.to_excel(writer, sheet_name='Internal Report', index=False)
-                
-                # Processor Reports (separate sheets)
-                for processor_name, records in processors.items():
-                    processor_df = pd.DataFrame(records)
-                    processor_df['Match_Status'] = processor_df['reference_number'].isin(matched_refs).map({True: 'MATCHED', False: 'UNMATCHED'})
-                    sheet_name = processor_name[:31]  # Excel sheet name limit
-                    processor_df.to_excel(writer, sheet_name=sheet_name, index=False)
-                
-                # Matched Transactions sheet
-                if reconciliation_result['matches']:
-                    matched_df = pd.DataFrame(reconciliation_result['matches'])
-                    matched_df.to_excel(writer, sheet_name='Matched Transactions', index=False)
-                
-                # Unmatched sheets
-                if reconciliation_result['unmatched_internal']:
-                    unmatched_int_df = pd.DataFrame(reconciliation_result['unmatched_internal'])
-                    unmatched_int_df.to_excel(writer, sheet_name='Unmatched Internal', index=False)
-                
-                if reconciliation_result['unmatched_processor']:
-                    unmatched_proc_df = pd.DataFrame(reconciliation_result['unmatched_processor'])
-                    unmatched_proc_df.to_excel(writer, sheet_name='Unmatched Processor', index=False)
-                
-                # Summary sheet
-                summary_data = {
-                    'Metric': [
-                        'Module', 'Currency', 'Total Internal Transactions', 'Total Processor Transactions',
-                        'Matched Transactions', 'Unmatched Internal', 'Unmatched Processor',
-                        'Total Internal Value', 'Total Processor Value', 'Matched Value',
-                        'Unmatched Internal Value', 'Unmatched Processor Value', 'Reconciliation Date'
-                    ],
-                    'Value': [
-                        module, currency,
-                        f"{reconciliation_result['summary']['total_internal']:,}",
-                        f"{reconciliation_result['summary']['total_processor']:,}",
-                        f"{reconciliation_result['summary']['matched_count']:,}",
-                        f"{reconciliation_result['summary']['unmatched_internal_count']:,}",
-                        f"{reconciliation_result['summary']['unmatched_processor_count']:,}",
-                        f"${reconciliation_result['summary']['total_internal_value']:,.2f}",
-                        f"${reconciliation_result['summary']['total_processor_value']:,.2f}",
-                        f"${reconciliation_result['summary']['matched_value']:,.2f}",
-                        f"${reconciliation_result['summary']['unmatched_internal_value']:,.2f}",
-                        f"${reconciliation_result['summary']['unmatched_processor_value']:,.2f}",
-                        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    ]
-                }
-                summary_df = pd.DataFrame(summary_data)
-                summary_df.to_excel(writer, sheet_name='Summary', index=False)
+            # Matched Transactions sheet
+            if len(result['matches']) > 0:
+                writer.add_frame('Matched Transactions', result['matches'])
             
-            # Send the Excel file
-            with open('full_reconciliation.xlsx', 'rb') as f:
-                excel_data = f.read()
-            os.remove('full_reconciliation.xlsx')
+            # Unmatched sheets
+            unmatched_int_df = unmatched_internal_frame(result)
+            if len(unmatched_int_df) > 0:
+                writer.add_frame('Unmatched Internal', unmatched_int_df)
+            
+            unmatched_proc_df = unmatched_processor_frame(result)
+            if len(unmatched_proc_df) > 0:
+                writer.add_frame('Unmatched Processor', unmatched_proc_df)
             
+            # Pairs found by the leftover passes, with both references for review
+            leftover_matches_df = result.get('leftover_matches', EMPTY_LEFTOVER_MATCHES)
+            if len(leftover_matches_df) > 0:
+                writer.add_frame('Leftover Matches', leftover_matches_df)
+            
+            # Processor rows paired with internal items carried from earlier uploads
+            carried_matches_df = result.get('carried_matches', EMPTY_CARRIED_MATCHES)
+            if len(carried_matches_df) > 0:
+                writer.add_frame('Carried Forward Matches', carried_matches_df)
+            
+            # Duplicate reference groups
+            duplicate_df = duplicate_groups_frame(result)
+            if len(duplicate_df) > 0:
+                writer.add_frame('Duplicate References', duplicate_df)
+            
+            # Summary sheet
+            summary_data = {
+                'Metric': [
+                    'Module', 'Currency', 'Total Internal Transactions', 'Total Processor Transactions',
+                    'Matched Transactions', 'Unmatched Internal', 'Unmatched Processor',
+                    'Total Internal Value', 'Total Processor Value', 'Matched Value',
+                    'Unmatched Internal Value', 'Unmatched Processor Value', 'Reconciliation Date'
+                ],
+                'Value': [
+                    module, currency,
+                    f"{result['summary']['total_internal']:,}",
+                    f"{result['summary']['total_processor']:,}",
+                    f"{result['summary']['matched_count']:,}",
+                    f"{result['summary']['unmatched_internal_count']:,}",
+                    f"{result['summary']['unmatched_processor_count']:,}",
+                    f"${result['summary']['total_internal_value']:,.2f}",
+                    f"${result['summary']['total_processor_value']:,.2f}",
+                    f"${result['summary']['matched_value']:,.2f}",
+                    f"${result['summary']['unmatched_internal_value']:,.2f}",
+                    f"${result['summary']['unmatched_processor_value']:,.2f}",
+                    datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                ]
+            }
+            summary_df = pd.DataFrame(summary_data)
+            writer.add_frame('Summary', summary_df)
+            writer.close()
+            g.timer.rows = len(internal_df) + len(processor_df)
+            g.timer.bytes_out = output.tell()
+            
+            # Send the Excel file
+            output.seek(0)
             return send_file(
-                io.BytesIO(excel_data),
+                output,
                 mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
                 as_attachment=True,
                 download_name=f'{module}_{currency}_full_reconciliation_{datetime.now().strftime("%Y%m%d")}.xlsx'
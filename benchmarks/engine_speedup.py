@@ -0,0 +1,85 @@
+"""Legacy vs columnar matching engines on stored datasets.
+
+Builds internal and processor datasets in the stored layout (references
+normalized and amounts in minor units at ingest, as uploads are), times each
+engine's match over them, checks that every engine returns the same matches
+and matched masks as the first one, and prints the results as JSON. The
+legacy engine includes its conversion of the frames to records, which is
+part of its cost in /reconcile.
+
+    python benchmarks/engine_speedup.py --rows 5000000 --engines legacy vectorized
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+import app  # noqa: E402
+from reconcile_suite import peak_rss_mb  # noqa: E402
+
+
+def synthetic_datasets(rows, seed):
+    """Stored internal and processor datasets with duplicate references, missing references and amount mismatches"""
+    rng = np.random.default_rng(seed)
+    internal_keys = np.array([f'TX{value:010d}' for value in rng.integers(0, rows, rows)], dtype=object)
+    internal_values = rng.integers(100, 10 ** 7, rows) / 100
+    picks = rng.integers(0, rows, rows)
+    processor_keys = internal_keys[picks].copy()
+    processor_keys[rng.random(rows) < 0.05] = 'MISSING'
+    # Off by a whole unit or not at all: legacy compares float differences against 0.01, which a
+    # one-cent offset passes or fails depending on rounding, while minor units compare exactly
+    processor_values = internal_values[picks] + rng.choice([0, 0, 0, 1], rows)
+    internal = app.build_dataset(pd.DataFrame({'reference_number': internal_keys, 'amount': internal_values}), 'KES')
+    processor = app.build_dataset(
+        pd.DataFrame({'reference_number': processor_keys, 'amount': processor_values}), 'KES', 'processor_1'
+    )
+    return internal, processor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000, help='rows per side')
+    parser.add_argument('--engines', nargs='+', default=['legacy', 'vectorized'], choices=sorted(app.MATCH_ENGINES))
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    internal, processor = synthetic_datasets(args.rows, args.seed)
+    results, expected = [], None
+    for engine in args.engines:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            output = app.MATCH_ENGINES[engine](internal, processor)
+            timings.append(time.perf_counter() - started)
+        if expected is None:
+            expected = output
+            identical = True
+        else:
+            identical = (
+                output[0].astype(object).equals(expected[0].astype(object))
+                and np.array_equal(output[1], expected[1]) and np.array_equal(output[2], expected[2])
+            )
+        results.append({
+            'engine': engine,
+            'seconds': round(min(timings), 3),
+            'rows_per_sec': int(2 * args.rows / min(timings)),
+            'matches': len(output[0]),
+            'identical': identical,
+            'peak_rss_mb': peak_rss_mb()
+        })
+        del output
+
+    baseline = results[0]['seconds']
+    for result in results:
+        result['speedup'] = round(baseline / result['seconds'], 2)
+    print(json.dumps({'rows': args.rows, 'cpu_count': os.cpu_count(), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
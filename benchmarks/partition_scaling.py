@@ -0,0 +1,88 @@
+"""Scaling curve for the hash-partitioned matcher.
+
+Times match_columns_partitioned against serial match_columns on synthetic
+columns for a range of worker counts, checks the output is identical and
+prints the results as JSON. Keys are integer reference codes and partitions
+follow the reference hashes, as match_frames passes them for stored datasets.
+Speedups need as many cores as workers; cpu_count is recorded with the run.
+
+    python benchmarks/partition_scaling.py --rows 2000000 --workers 1 2 4 8 16 --output scaling.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+import app  # noqa: E402
+
+
+def synthetic_columns(rows, seed):
+    """Internal and processor code/amount columns with duplicates, misses and tolerance hits, and their reference hashes"""
+    rng = np.random.default_rng(seed)
+    internal_keys = np.array([f'TX{value:010d}' for value in rng.integers(0, rows, rows)], dtype=object)
+    internal_values = rng.integers(100, 10 ** 7, rows) / 100
+    picks = rng.integers(0, rows, rows)
+    processor_keys = internal_keys[picks].copy()
+    processor_keys[rng.random(rows) < 0.05] = 'MISSING'
+    processor_values = internal_values[picks] + rng.choice([0, 0, 0, 0.005, 1], rows)
+    codes, _ = pd.factorize(np.concatenate([internal_keys, processor_keys]))
+    columns, hashes = [], {}
+    for side, keys, side_codes, values in (('internal', internal_keys, codes[:rows], internal_values),
+                                           ('processor', processor_keys, codes[rows:], processor_values)):
+        _, scaled, valid = app.to_minor_units(values, 'KES')
+        columns += [side_codes, scaled, valid]
+        hashes[f'{side}_hash'] = app.reference_hashes(keys)[0]
+    return columns, hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    columns, hashes = synthetic_columns(args.rows, args.seed)
+    started = time.perf_counter()
+    expected = app.match_columns(*columns)
+    serial = time.perf_counter() - started
+
+    results = []
+    for workers in args.workers:
+        timings = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            output = app.match_columns_partitioned(*columns, workers=workers, **hashes)
+            timings.append(time.perf_counter() - started)
+        identical = all(np.array_equal(got, want) for got, want in zip(output, expected))
+        best = min(timings)
+        results.append({
+            'workers': workers,
+            'seconds': round(best, 3),
+            'speedup': round(serial / best, 2),
+            'rows_per_sec': int(2 * args.rows / best),
+            'identical': identical
+        })
+
+    report = json.dumps({
+        'rows': args.rows,
+        'cpu_count': os.cpu_count(),
+        'serial_seconds': round(serial, 3),
+        'matches': len(expected[0]),
+        'results': results
+    }, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(report + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""End-to-end benchmark for ingest, match, summarize and export.
+
+Generates synthetic internal and processor CSV reports, then times the upload,
+legacy find_matches_optimized, the match engines, the /reconcile aggregation
+and every /download report type through the Flask test client. Each operation
+reports latency percentiles, rows/sec and peak RSS; the whole run is printed
+as JSON so results can be compared across commits.
+
+    python benchmarks/reconcile_suite.py --rows 1000000 --processors 4 --repeat 5 --output bench.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+import app  # noqa: E402
+
+MODULE = 'collections'
+
+
+def synthetic_reports(rows, processors, duplicate_rate, mismatch_rate, seed):
+    """Internal CSV bytes and a list of (processor_name, CSV bytes) with duplicates and mismatches"""
+    rng = np.random.default_rng(seed)
+    references = np.array([f'TX{value:010d}' for value in range(rows)], dtype=object)
+    amounts = rng.integers(100, 10 ** 7, rows) / 100
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 90, rows), unit='D')
+
+    # Duplicated references reuse an earlier row's reference with its own amount
+    internal_references = references.copy()
+    duplicates = rng.random(rows) < duplicate_rate
+    internal_references[duplicates] = references[rng.integers(0, rows, int(duplicates.sum()))]
+    internal = pd.DataFrame({
+        'reference_number': internal_references,
+        'amount': amounts,
+        'description': 'Synthetic payment',
+        'transaction_date': dates.strftime('%Y-%m-%d')
+    })
+
+    # Processor rows cover the internal rows; mismatches either lose the reference or shift the amount
+    picks = rng.permutation(rows)
+    processor_references = internal_references[picks].copy()
+    processor_amounts = amounts[picks].copy()
+    mismatched = rng.random(rows) < mismatch_rate
+    missing = mismatched & (rng.random(rows) < 0.5)
+    processor_references[missing] = np.array([f'PX{value:010d}' for value in np.flatnonzero(missing)], dtype=object)
+    processor_amounts[mismatched & ~missing] += 1
+    extra = rng.random(rows) < duplicate_rate
+    processor = pd.DataFrame({
+        'reference_number': np.concatenate([processor_references, processor_references[extra]]),
+        'amount': np.concatenate([processor_amounts, processor_amounts[extra]]),
+        'transaction_date': np.concatenate([dates[picks].strftime('%Y-%m-%d'), dates[picks][extra].strftime('%Y-%m-%d')])
+    })
+
+    internal_csv = internal.to_csv(index=False).encode()
+    processor_csvs = [
+        (f'processor_{index + 1}', part.to_csv(index=False).encode())
+        for index, part in enumerate(np.array_split(processor, processors))
+    ]
+    return internal_csv, processor_csvs
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(operation, rows, repeat, setup=None):
+    """Run operation repeat times (after setup, untimed) and summarize its latency"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - started)
+    timings = np.array(timings) * 1000
+    p50 = float(np.percentile(timings, 50))
+    return {
+        'rows': rows,
+        'runs': repeat,
+        'p50_ms': round(p50, 2),
+        'p95_ms': round(float(np.percentile(timings, 95)), 2),
+        'p99_ms': round(float(np.percentile(timings, 99)), 2),
+        'min_ms': round(float(timings.min()), 2),
+        'max_ms': round(float(timings.max()), 2),
+        'rows_per_sec': int(rows / (p50 / 1000)) if p50 > 0 else None,
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+
+def check(response):
+    """Drain a test client response (streamed bodies included) and fail loudly on errors"""
+    body = response.get_data()
+    response.close()
+    if response.status_code != 200:
+        raise RuntimeError(f'{response.request.path} returned {response.status_code}: {body[:200]!r}')
+    return body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--processors', type=int, default=3)
+    parser.add_argument('--duplicate-rate', type=float, default=0.01)
+    parser.add_argument('--mismatch-rate', type=float, default=0.05)
+    parser.add_argument('--currency', default='KES', choices=app.CURRENCIES)
+    parser.add_argument('--engines', nargs='+', default=[app.MATCH_ENGINE], choices=sorted(app.MATCH_ENGINES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-legacy', action='store_true', help='skip the row-by-row find_matches_optimized timing')
+    parser.add_argument('--output', help='also write the JSON results to this file')
+    args = parser.parse_args()
+
+    internal_csv, processor_csvs = synthetic_reports(
+        args.rows, args.processors, args.duplicate_rate, args.mismatch_rate, args.seed
+    )
+    processor_rows = sum(csv.count(b'\n') - 1 for _, csv in processor_csvs)
+    total_rows = args.rows + processor_rows
+    client = app.app.test_client()
+    selection = {'module': MODULE, 'currency': args.currency}
+    results = {}
+
+    def upload(file_type, content, processor_name=None):
+        data = dict(selection, file=(io.BytesIO(content), f'{file_type}.csv'))
+        if processor_name:
+            data['processor_name'] = processor_name
+        check(client.post(f'/upload/{file_type}', data=data, content_type='multipart/form-data'))
+
+    def upload_all():
+        upload('internal', internal_csv)
+        for processor_name, content in processor_csvs:
+            upload('processor', content, processor_name)
+
+    def reset_storage():
+        app.storage = app.create_storage('memory')
+        app.invalidate_reconciliation(MODULE, args.currency)
+
+    results['upload'] = measure(upload_all, total_rows, args.repeat, setup=reset_storage)
+
+    # Every repeat starts from empty storage, so the slot must hold exactly one upload of each report
+    slot = app.storage.get_slot(MODULE, args.currency)
+    loaded = (len(slot['internal']), len(slot['processor_data']))
+    if loaded != (args.rows, processor_rows):
+        raise RuntimeError(f'slot holds {loaded} internal/processor rows, expected {(args.rows, processor_rows)}')
+    results['stored'] = {
+        name: {
+            'rows': len(slot[name]),
+            'mb': round(slot[name].memory_usage(deep=True).sum() / 2 ** 20, 1),
+            'bytes_per_row': int(slot[name].memory_usage(deep=True).sum() / max(len(slot[name]), 1))
+        }
+        for name in ('internal', 'processor_data')
+    }
+    if not args.skip_legacy:
+        internal_records = app.frame_to_records(slot['internal'])
+        processor_records = app.frame_to_records(slot['processor_data'])
+        results['find_matches_optimized'] = measure(
+            lambda: app.find_matches_optimized(internal_records, processor_records), total_rows, args.repeat
+        )
+        del internal_records, processor_records
+
+    for engine in args.engines:
+        matcher = app.MATCH_ENGINES[engine]
+        results[f'match[{engine}]'] = measure(
+            lambda: matcher(slot['internal'], slot['processor_data']), total_rows, args.repeat
+        )
+
+        # Clearing the result cache makes every run match and aggregate from scratch
+        results[f'reconcile[{engine}]'] = measure(
+            lambda: check(client.post('/reconcile', json=dict(selection, engine=engine))), total_rows, args.repeat,
+            setup=lambda: app.invalidate_reconciliation(MODULE, args.currency)
+        )
+
+        # Downloads reuse the cached result, so these time report generation only
+        for report_type in [*app.CSV_REPORTS, 'full_reconciliation']:
+            results[f'download[{engine}]/{report_type}'] = measure(
+                lambda: check(client.post(f'/download/{report_type}', json=dict(selection, engine=engine))),
+                total_rows, args.repeat
+            )
+        results[f'download[{engine}]/matched.gz'] = measure(
+            lambda: check(client.post('/download/matched', json=dict(selection, engine=engine, gzip=True))),
+            total_rows, args.repeat
+        )
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'config': {
+            'internal_rows': args.rows,
+            'processor_rows': processor_rows,
+            'processors': args.processors,
+            'duplicate_rate': args.duplicate_rate,
+            'mismatch_rate': args.mismatch_rate,
+            'currency': args.currency,
+            'repeat': args.repeat,
+            'seed': args.seed
+        },
+        'peak_rss_mb': peak_rss_mb(),
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as handle:
+            handle.write(output + '\n')
+
+
+if __name__ == '__main__':
+    main()
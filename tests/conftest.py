@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+import app  # noqa: E402
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    monkeypatch.setattr(app, 'storage', app.create_storage('memory'))
+    monkeypatch.setattr(app, 'incremental_state', {})
+    yield app.storage
+    with app.result_cache_lock:
+        app.result_cache.clear()
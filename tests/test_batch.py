@@ -0,0 +1,33 @@
+import pandas as pd
+
+import app
+
+
+def load_slot(storage, module, currency, references):
+    internal = pd.DataFrame({'reference_number': references, 'amount': range(1, len(references) + 1)})
+    processor = internal.iloc[1:]
+    storage.set_internal(module, currency, [app.build_dataset(internal, currency)])
+    storage.append_processor(module, currency, [app.build_dataset(processor, currency, 'mpesa')])
+
+
+def test_batch_results_fill_the_result_cache(storage):
+    slots = [(app.MODULES[0], app.CURRENCIES[0]), (app.MODULES[0], app.CURRENCIES[1])]
+    for module, currency in slots:
+        load_slot(storage, module, currency, ['A', 'B', 'C'])
+
+    results = app.reconcile_batch(slots, 'vectorized')
+
+    for (module, currency), result in zip(slots, results):
+        assert result['summary']['matched_count'] == 2
+        cached = app.cached_reconciliation((module, currency, 'vectorized'), storage.get_slot(module, currency)['version'])
+        assert cached is not None and cached['summary'] == result['summary']
+
+
+def test_batch_route_is_recorded_in_metrics(storage):
+    load_slot(storage, app.MODULES[0], app.CURRENCIES[0], ['A', 'B', 'C'])
+    slots = [{'module': app.MODULES[0], 'currency': app.CURRENCIES[0]}]
+
+    response = app.app.test_client().post('/reconcile/batch', json={'slots': slots, 'engine': 'vectorized'})
+
+    assert response.status_code == 200
+    assert 'operation="reconcile_batch"' in app.app.test_client().get('/metrics').get_data(as_text=True)
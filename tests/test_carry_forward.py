@@ -0,0 +1,72 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import app
+
+MODULE, CURRENCY = app.MODULES[0], 'KES'
+
+
+@pytest.fixture
+def open_items(storage, monkeypatch, tmp_path):
+    index = app.OpenItemsIndex(str(tmp_path / 'open_items.db'))
+    monkeypatch.setattr(app, 'open_items', index)
+    return index
+
+
+def upload(storage, internal=None, processor=None):
+    if internal is not None:
+        frame = pd.DataFrame({'reference_number': [key for key, _ in internal], 'amount': [value for _, value in internal]})
+        storage.set_internal(MODULE, CURRENCY, [app.build_dataset(frame, CURRENCY)])
+    if processor is not None:
+        frame = pd.DataFrame({'reference_number': [key for key, _ in processor], 'amount': [value for _, value in processor]})
+        storage.append_processor(MODULE, CURRENCY, [app.build_dataset(frame, CURRENCY, 'mpesa')])
+
+
+def reconcile(record):
+    app.invalidate_reconciliation(MODULE, CURRENCY)
+    return app.get_reconciliation(MODULE, CURRENCY, 'vectorized', record=record)
+
+
+def items(index):
+    with sqlite3.connect(index.path) as connection:
+        return connection.execute('SELECT reference, status, matched_at FROM open_items ORDER BY id').fetchall()
+
+
+def test_read_only_runs_write_nothing(storage, open_items):
+    upload(storage, internal=[('A', 10), ('B', 20)], processor=[('A', 10)])
+
+    reconcile(record=False)
+
+    assert items(open_items) == []
+
+
+def test_later_processor_row_retires_a_carried_item(storage, open_items):
+    upload(storage, internal=[('A', 10), ('B', 20)], processor=[('A', 10)])
+    reconcile(record=True)
+    assert items(open_items) == [('B', 'open', None)]
+
+    # The next day's internal file no longer has B; the processor row for it arrives late
+    upload(storage, internal=[('C', 30)], processor=[('B', 20)])
+    result = reconcile(record=True)
+
+    assert result['carried_matches']['reference'].tolist() == ['B']
+    assert result['processor_matched'].tolist() == [False, True]
+    assert [(reference, status) for reference, status, _ in items(open_items)] == [('B', 'matched'), ('C', 'open')]
+
+
+def test_rerun_does_not_retire_twice(storage, open_items):
+    upload(storage, internal=[('A', 10), ('B', 20)], processor=[('A', 10)])
+    reconcile(record=True)
+    upload(storage, internal=[('C', 30)], processor=[('B', 20)])
+    reconcile(record=True)
+
+    rerun = reconcile(record=True)
+    recorded = items(open_items)
+    lookup = reconcile(record=False)
+
+    assert rerun['carried_matches']['reference'].tolist() == ['B']
+    assert lookup['carried_matches']['reference'].tolist() == ['B']
+    assert [(reference, status) for reference, status, _ in recorded] == [('B', 'matched'), ('C', 'open')]
+    assert items(open_items) == recorded
@@ -0,0 +1,120 @@
+import io
+from datetime import datetime
+
+import openpyxl
+import pandas as pd
+import pytest
+
+import app
+
+
+def workbook_bytes(rows):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in rows:
+        sheet.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+STATEMENT = workbook_bytes([
+    ['notes', 'reference_number', 'amount', 'description', 'transaction_date'],
+    ['skip me', 'TX1', 10.5, 'Card payment', datetime(2024, 1, 2)],
+    [None, 12345, 20, None, datetime(2024, 1, 3)],
+    ['skip me too', ' TX3 ', -3.25, 'Refund', '2024-01-04'],
+    [None, 'TX4', 0, 'Card payment', None]
+])
+
+
+@pytest.fixture(autouse=True)
+def empty_excel_cache():
+    app.excel_cache.clear()
+    yield
+    app.excel_cache.clear()
+
+
+def test_streaming_reader_matches_pandas_after_ingest(monkeypatch):
+    monkeypatch.setattr(app, 'CSV_CHUNK_ROWS', 3)
+
+    batches = app.read_excel_batches(STATEMENT)
+    streamed = app.build_dataset(pd.concat(batches, ignore_index=True), 'KES')
+    parsed = app.build_dataset(app.read_excel_cached(STATEMENT, 'pandas')[0][0][app.INGEST_COLUMNS], 'KES')
+
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert list(batches[0].columns) == ['reference_number', 'amount', 'description', 'transaction_date']
+    assert streamed['reference_number'].tolist() == ['TX1', '12345', 'TX3', 'TX4']
+    assert streamed['transaction_date'].tolist()[:3] == [pd.Timestamp(f'2024-01-0{day}') for day in (2, 3, 4)]
+    pd.testing.assert_frame_equal(streamed, parsed[streamed.columns], check_categorical=False)
+
+
+def test_streaming_reader_reads_inline_strings_and_sparse_cells():
+    buffer = io.BytesIO()
+    writer = app.XlsxStreamWriter(buffer)
+    writer.add_frame('Statement', pd.DataFrame({
+        'reference_number': ['TX1', None, 'TX3'],
+        'amount': [1.5, 2.0, None]
+    }))
+    writer.close()
+
+    batch, = app.read_excel_batches(buffer.getvalue())
+
+    assert batch['reference_number'].tolist() == ['TX1', None, 'TX3']
+    assert batch['amount'].tolist()[:2] == [1.5, 2]
+    assert pd.isna(batch['amount'].tolist()[2])
+
+
+def test_excel_cache_is_keyed_by_reader():
+    assert app.read_excel_cached(STATEMENT, 'streaming')[1] == 'streaming'
+    assert app.read_excel_cached(STATEMENT, 'pandas')[1] == 'pandas'
+    assert app.read_excel_cached(STATEMENT, 'pandas')[1] == 'cache'
+
+
+@pytest.mark.parametrize('filename, reader, error', [
+    ('statement.xls', 'streaming', 'only reads .xlsx'),
+    ('statement.xlsx', 'openpyxl', 'excel_reader must be one of')
+])
+def test_upload_rejects_unusable_excel_readers(storage, filename, reader, error):
+    response = app.app.test_client().post('/upload/internal', data={
+        'module': app.MODULES[0], 'currency': 'KES', 'excel_reader': reader,
+        'file': (io.BytesIO(STATEMENT), filename)
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+
+
+def test_stream_writer_round_trips_through_openpyxl_and_pandas():
+    frame = pd.DataFrame({
+        'reference': ['TX1', 'A & <B>', 'line\nbreak', None],
+        'amount': [10.5, float('nan'), -3.25, 1e-07],
+        'count': [1, 2, 3, 4],
+        'flag': [True, False, True, False],
+        'date': pd.to_datetime(['2024-01-02', None, '2024-03-04', '2024-12-31']),
+        'stamp': pd.to_datetime(['2024-01-02 08:30:00', '2024-01-02 00:00:00', None, '2024-01-03 23:59:59']),
+        'processor': pd.Categorical(['mpesa', None, 'bank', 'mpesa']),
+        'mixed': ['text\x01', 7, 2.5, None]
+    })
+    buffer = io.BytesIO()
+    writer = app.XlsxStreamWriter(buffer)
+    writer.add_frame('Matches', frame)
+    writer.add_frame('Matches', frame.iloc[:0])
+    writer.close()
+
+    workbook = openpyxl.load_workbook(io.BytesIO(buffer.getvalue()))
+    assert workbook.sheetnames == ['Matches', 'Matches (2)']
+    rows = list(workbook['Matches'].values)
+    assert rows[0] == tuple(frame.columns)
+    assert workbook['Matches']['A1'].font.b
+    assert rows[1:] == [
+        ('TX1', 10.5, 1, True, '2024-01-02', '2024-01-02 08:30:00', 'mpesa', 'text'),
+        ('A & <B>', None, 2, False, None, '2024-01-02 00:00:00', None, 7),
+        ('line\nbreak', -3.25, 3, True, '2024-03-04', None, 'bank', 2.5),
+        (None, 1e-07, 4, False, '2024-12-31', '2024-01-03 23:59:59', 'mpesa', None)
+    ]
+    assert list(workbook['Matches (2)'].values) == [tuple(frame.columns)]
+
+    read = pd.read_excel(io.BytesIO(buffer.getvalue()), sheet_name='Matches')
+    assert read['amount'].isna().tolist() == [False, True, False, False]
+    assert read['count'].tolist() == [1, 2, 3, 4]
+    assert read['reference'].iloc[:3].tolist() == ['TX1', 'A & <B>', 'line\nbreak']
@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+import app
+
+MODULE, CURRENCY = app.MODULES[0], app.CURRENCIES[0]
+
+
+def processor_upload(references):
+    frame = pd.DataFrame({'reference_number': references, 'amount': [1.0] * len(references)})
+    return [app.build_dataset(frame, CURRENCY, 'mpesa')]
+
+
+def test_delta_covers_rows_since_the_last_run_on_any_worker(storage, monkeypatch):
+    internal = pd.DataFrame({'reference_number': ['A', 'B', 'C'], 'amount': [1.0] * 3})
+    storage.set_internal(MODULE, CURRENCY, [app.build_dataset(internal, CURRENCY)])
+    storage.append_processor(MODULE, CURRENCY, processor_upload(['A']))
+    result, _ = app.get_incremental_reconciliation(MODULE, CURRENCY)
+    app.commit_incremental_delta(MODULE, CURRENCY, result)
+
+    # Another worker answers next: its own index is empty, but the rows reported so far are shared
+    monkeypatch.setattr(app, 'incremental_state', {})
+    storage.append_processor(MODULE, CURRENCY, processor_upload(['B']))
+    result, delta = app.get_incremental_reconciliation(MODULE, CURRENCY)
+
+    assert delta['processor_rows_added'] == 1
+    assert [match['reference'] for match in delta['matches']] == ['B']
+    assert result['summary']['matched_count'] == 2
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_rows_of_a_failed_run_are_reported_again(storage, monkeypatch, tmp_path, backend):
+    if backend == 'sqlite':
+        storage = app.SQLiteStorage(str(tmp_path / 'reconciliation.db'))
+        monkeypatch.setattr(app, 'storage', storage)
+    internal = pd.DataFrame({'reference_number': ['A', 'B', 'C'], 'amount': [1.0] * 3})
+    storage.set_internal(MODULE, CURRENCY, [app.build_dataset(internal, CURRENCY)])
+    storage.append_processor(MODULE, CURRENCY, processor_upload(['A']))
+    app.reconcile_slot(MODULE, CURRENCY, 'vectorized', True)
+
+    storage.append_processor(MODULE, CURRENCY, processor_upload(['B']))
+    def fail(payload):
+        raise RuntimeError('job result not saved')
+    with pytest.raises(RuntimeError):
+        app.reconcile_slot(MODULE, CURRENCY, 'vectorized', True, deliver=fail)
+
+    storage.append_processor(MODULE, CURRENCY, processor_upload(['C']))
+    delta = app.reconcile_slot(MODULE, CURRENCY, 'vectorized', True)['delta']
+
+    assert delta['processor_rows_added'] == 2
+    assert [match['reference'] for match in delta['matches']] == ['B', 'C']
+    assert app.reconcile_slot(MODULE, CURRENCY, 'vectorized', True)['delta']['processor_rows_added'] == 0
+
+
+def test_incremental_result_is_not_cached_for_full_runs_with_leftover_passes(storage, monkeypatch):
+    monkeypatch.setattr(app, 'LEFTOVER_PASSES', ['fuzzy_reference'])
+    internal = pd.DataFrame({'reference_number': ['A', 'TXN-00B'], 'amount': [1.0, 1.0]})
+    storage.set_internal(MODULE, CURRENCY, [app.build_dataset(internal, CURRENCY)])
+    storage.append_processor(MODULE, CURRENCY, processor_upload(['A', 'B']))
+
+    incremental, _ = app.get_incremental_reconciliation(MODULE, CURRENCY)
+    full = app.get_reconciliation(MODULE, CURRENCY, 'vectorized')
+
+    assert incremental['summary']['matched_count'] == 1
+    assert full['summary']['matched_count'] == 2
@@ -0,0 +1,33 @@
+import time
+
+import pandas as pd
+
+import app
+
+SELECTION = {'module': app.MODULES[0], 'currency': 'KES'}
+
+
+def test_memory_backend_refuses_background_jobs(storage):
+    response = app.app.test_client().post('/reconcile/jobs', json=SELECTION)
+
+    assert response.status_code == 409
+    assert response.get_json()['reconcile_url'] == '/reconcile'
+
+
+def test_sqlite_jobs_can_be_polled_to_their_result(storage, monkeypatch, tmp_path):
+    sqlite_storage = app.SQLiteStorage(str(tmp_path / 'reconciliation.db'))
+    monkeypatch.setattr(app, 'storage', sqlite_storage)
+    frame = pd.DataFrame({'reference_number': ['A', 'B'], 'amount': [1.0, 2.0]})
+    sqlite_storage.set_internal(SELECTION['module'], 'KES', [app.build_dataset(frame, 'KES')])
+    sqlite_storage.append_processor(SELECTION['module'], 'KES', [app.build_dataset(frame.iloc[:1], 'KES', 'mpesa')])
+    client = app.app.test_client()
+
+    job = client.post('/reconcile/jobs', json=SELECTION).get_json()
+    deadline = time.monotonic() + 30
+    while job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+        time.sleep(0.05)
+        job = client.get(f"/reconcile/jobs/{job['job_id']}").get_json()
+
+    assert job['status'] == 'done'
+    assert client.get(f"/reconcile/jobs/{job['job_id']}/result").get_json()['summary']['matched_count'] == 1
+    assert client.get('/reconcile/jobs/unknown').status_code == 404
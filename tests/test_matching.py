@@ -0,0 +1,221 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+
+def dataset(references, amounts, processor_name=None, currency='KES'):
+    frame = pd.DataFrame({'reference_number': references, 'amount': amounts})
+    return app.build_dataset(frame, currency, processor_name)
+
+
+@pytest.mark.parametrize('engine', sorted(app.MATCH_ENGINES))
+def test_blank_references_never_match(engine):
+    internal = dataset([None, None, None, 'R1'], [10, 20, 30, 5])
+    processor = dataset([None, '  ', None, 'R1'], [30, 99, 20, 5], 'mpesa')
+
+    matches, internal_matched, processor_matched = app.MATCH_ENGINES[engine](internal, processor)
+
+    assert matches['reference'].tolist() == ['R1']
+    assert internal_matched.tolist() == [False, False, False, True]
+    assert processor_matched.tolist() == [False, False, False, True]
+
+
+def test_incremental_state_skips_blank_references():
+    slot = {
+        'internal': dataset([None, 'R1'], [30, 5]),
+        'processor_data': dataset([None, 'R1'], [30, 5], 'mpesa'),
+        'version': (1, 1)
+    }
+    state = app.new_incremental_state(slot)
+    _, new_matches = app.advance_incremental_state(state, slot)
+
+    assert new_matches['reference'].tolist() == ['R1']
+    assert state['matched_keys'][state['internal_codes']].tolist() == [False, True]
+
+
+def dated(references, amounts, dates, processor_name=None):
+    frame = pd.DataFrame({'reference_number': references, 'amount': amounts, 'transaction_date': dates})
+    return app.build_dataset(frame, 'KES', processor_name)
+
+
+def test_amount_date_pass_needs_an_unreferenced_side():
+    internal = dated(['Q1', None, 'Q3'], [10, 20, 30], ['2024-01-01'] * 3)
+    processor = dated(['ZZ', 'BANK2', 'N/A'], [10, 20, 30], ['2024-01-01'] * 3, 'bank')
+    rows = np.arange(3)
+
+    internal_rows, processor_rows, _, _ = app.amount_date_pass(internal, processor, rows, rows)
+
+    assert sorted(zip(internal_rows.tolist(), processor_rows.tolist())) == [(1, 1), (2, 2)]
+
+
+def test_amount_date_pass_pairs_equal_amounts_first_then_the_closest_within_tolerance(monkeypatch):
+    monkeypatch.setitem(app.AMOUNT_TOLERANCE, 'KES', 50)
+    internal = dated([None] * 3, [10, 20, 30], ['2024-01-01'] * 3)
+    processor = dated(
+        [None] * 6, [10.4, 10, 19.7, 20.2, 30.1, 30.3],
+        ['2024-01-01'] * 4 + ['2024-01-10', '2024-01-02'], 'bank'
+    )
+
+    internal_rows, processor_rows, _, _ = app.amount_date_pass(internal, processor, np.arange(3), np.arange(6))
+
+    # 30.10 is within tolerance but eight days out
+    assert sorted(zip(internal_rows.tolist(), processor_rows.tolist())) == [(0, 1), (1, 3), (2, 5)]
+
+
+def test_pair_amount_date_rows_keeps_pairs_within_tolerance_and_window():
+    rng = np.random.default_rng(3)
+    amounts = [rng.integers(0, 200, 400), rng.integers(0, 200, 500)]
+    days = [rng.integers(0, 20, 400), rng.integers(0, 20, 500)]
+
+    internal_rows, processor_rows = app.pair_amount_date_rows(
+        amounts[0], days[0], np.arange(400), amounts[1], days[1], np.arange(500), 7
+    )
+    exact_rows, _ = app.pair_amount_date_rows(amounts[0], days[0], np.arange(400), amounts[1], days[1], np.arange(500), 0)
+
+    assert len(set(internal_rows.tolist())) == len(internal_rows)
+    assert len(set(processor_rows.tolist())) == len(processor_rows)
+    assert (np.abs(amounts[0][internal_rows] - amounts[1][processor_rows]) <= 7).all()
+    assert (np.abs(days[0][internal_rows] - days[1][processor_rows]) <= app.DATE_WINDOW_DAYS).all()
+    assert set(exact_rows.tolist()) <= set(internal_rows.tolist())
+    assert len(internal_rows) > len(exact_rows)
+
+
+def test_partitioned_matches_concurrent_calls_like_match_columns():
+    rng = np.random.default_rng(0)
+    cases = []
+    for seed in range(4):
+        keys = np.array([f'R{value}' for value in rng.integers(0, 300, 2000)], dtype=object)
+        amounts = rng.integers(0, 50, 2000)
+        valid = rng.random(2000) > 0.05
+        cases.append((keys[:1000], amounts[:1000], valid[:1000], keys[1000:], amounts[1000:], valid[1000:], seed))
+
+    with ThreadPoolExecutor(max_workers=4) as threads:
+        partitioned = list(threads.map(lambda case: app.match_columns_partitioned(*case, workers=3), cases))
+
+    for case, result in zip(cases, partitioned):
+        for actual, expected in zip(result, app.match_columns(*case)):
+            np.testing.assert_array_equal(actual, expected)
+
+
+def test_partitioned_splits_on_reference_hashes_and_removes_mapped_columns(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'PARTITION_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'PARTITION_WORKERS', 3)
+    rng = np.random.default_rng(1)
+    internal = dataset([f'R{value}' for value in rng.integers(0, 200, 1000)], rng.integers(0, 20, 1000))
+    processor = dataset([f'R{value}' for value in rng.integers(0, 200, 1000)], rng.integers(0, 20, 1000), 'mpesa')
+
+    actual = app.match_frames_partitioned(internal, processor)
+    expected = app.match_frames(internal, processor)
+
+    pd.testing.assert_frame_equal(actual[0], expected[0])
+    np.testing.assert_array_equal(actual[1], expected[1])
+    np.testing.assert_array_equal(actual[2], expected[2])
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_match_frames_equals_legacy(seed):
+    rng = np.random.default_rng(seed)
+    references = np.array([f'R{value}' for value in range(60)] + [None, '', '  '], dtype=object)
+
+    def report(rows, processor_name=None):
+        amounts = rng.integers(1, 4, rows) + rng.choice([0, 0.25], rows)
+        amounts[rng.random(rows) < 0.1] = np.nan
+        return dataset(rng.choice(references, rows), amounts, processor_name)
+
+    internal, processor = report(200), report(300, 'mpesa')
+
+    expected = app.match_frames_legacy(internal, processor)
+    actual = app.match_frames(internal, processor)
+
+    pd.testing.assert_frame_equal(actual[0], expected[0], check_dtype=False)
+    np.testing.assert_array_equal(actual[1], expected[1])
+    np.testing.assert_array_equal(actual[2], expected[2])
+
+
+def test_reference_codes_fall_back_to_strings_on_a_hash_collision():
+    internal = dataset(['A', 'B'], [1, 2])
+    processor = dataset(['B', 'A'], [2, 1], 'mpesa')
+    # Pretend 'A' and 'B' share a join hash; their check hashes still differ
+    internal['reference_hash'] = processor['reference_hash'] = np.uint64(7)
+
+    internal_codes, processor_codes = app.reference_codes(internal, processor)
+
+    assert internal_codes.tolist() == [0, 1]
+    assert processor_codes.tolist() == [1, 0]
+    assert app.match_frames(internal, processor)[0]['reference'].tolist() == ['A', 'B']
+
+
+def test_match_frames_hashes_datasets_stored_without_reference_hashes():
+    internal = dataset(['A', 'B', 'C'], [1, 2, 3]).drop(columns=['reference_hash', 'reference_check'])
+    processor = dataset(['C', 'A'], [3, 1], 'mpesa')
+
+    matches, internal_matched, _ = app.match_frames(internal, processor)
+
+    assert matches['reference'].tolist() == ['A', 'C']
+    assert internal_matched.tolist() == [True, False, True]
+
+
+def test_reference_codes_accept_datasets_stored_with_64_bit_checks():
+    internal = dataset(['A', 'B'], [1, 2])
+    internal['reference_check'] = pd.util.hash_array(
+        internal['reference_number'].to_numpy(dtype=object), hash_key=app.REFERENCE_CHECK_KEY, categorize=False
+    )
+    processor = dataset(['B', 'A'], [2, 1], 'mpesa')
+
+    internal_codes, processor_codes = app.reference_codes(internal, processor)
+
+    assert processor['reference_check'].dtype == np.uint32
+    assert internal_codes.tolist() == [0, 1]
+    assert processor_codes.tolist() == [1, 0]
+
+
+def one_to_one(internal_keys, internal_amounts, processor_keys, processor_amounts, tolerance=0):
+    internal_rows, processor_rows, internal_matched, processor_matched = app.match_columns_one_to_one(
+        np.array(internal_keys, dtype=object), np.array(internal_amounts, dtype=np.int64),
+        np.ones(len(internal_keys), dtype=bool), np.array(processor_keys, dtype=object),
+        np.array(processor_amounts, dtype=np.int64), np.ones(len(processor_keys), dtype=bool), tolerance
+    )
+    pairs = list(zip(internal_rows.tolist(), processor_rows.tolist()))
+    return pairs, internal_matched.tolist(), processor_matched.tolist()
+
+
+def test_one_to_one_pairs_kth_occurrences_of_equal_amounts():
+    pairs, internal_matched, processor_matched = one_to_one(['A', 'A', 'A'], [5, 5, 7], ['A'] * 4, [7, 5, 5, 5])
+
+    assert pairs == [(0, 1), (1, 2), (2, 0)]
+    assert internal_matched == [True, True, True]
+    assert processor_matched == [True, True, True, False]
+
+
+def test_one_to_one_tolerance_walk_beats_row_order_greedy():
+    # Row order would give internal 11 the processor 10 and leave internal 10 without a partner
+    pairs, _, processor_matched = one_to_one(['A', 'A'], [11, 10], ['A', 'A'], [10, 12], tolerance=1)
+
+    assert pairs == [(0, 1), (1, 0)]
+    assert processor_matched == [True, True]
+
+
+def test_one_to_one_tolerance_walk_beats_closest_first_greedy():
+    # Closest first would pair 108 with 106 and leave 100 and 115 apart by more than the tolerance
+    pairs, _, _ = one_to_one(['A', 'A'], [100, 108], ['A', 'A'], [106, 115], tolerance=8)
+
+    assert pairs == [(0, 0), (1, 1)]
+
+
+def test_one_to_one_walk_stays_within_each_reference():
+    pairs, _, _ = one_to_one(['B', 'A', 'B'], [20, 10, 31], ['A', 'B', 'B'], [11, 30, 21], tolerance=1)
+
+    assert pairs == [(0, 2), (2, 1), (1, 0)]
+
+
+def test_one_to_one_exact_pairs_take_precedence():
+    pairs, internal_matched, processor_matched = one_to_one(['A', 'A'], [10, 11], ['A', 'A'], [11, 12], tolerance=1)
+
+    assert pairs == [(1, 0)]
+    assert internal_matched == [False, True]
+    assert processor_matched == [True, False]
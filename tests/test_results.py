@@ -0,0 +1,27 @@
+import pandas as pd
+
+import app
+
+
+def test_duplicate_groups_are_built_on_first_use(storage):
+    module, currency = app.MODULES[0], app.CURRENCIES[0]
+    internal = pd.DataFrame({'reference_number': ['A', 'B', 'A', 'C'], 'amount': [1, 2, 3, 4]})
+    processor = pd.DataFrame({'reference_number': ['B', 'A', 'B', 'D'], 'amount': [2, 1, 5, 6]})
+    storage.set_internal(module, currency, [app.build_dataset(internal, currency)])
+    storage.append_processor(module, currency, [app.build_dataset(processor, currency, 'mpesa')])
+    result = app.get_reconciliation(module, currency, 'vectorized')
+
+    assert app.result_set_links(module, currency, 'vectorized', result)['duplicate_groups']['count'] is None
+
+    groups = app.duplicate_groups_frame(result)
+
+    assert groups['reference'].tolist() == ['A', 'B']
+    assert groups['internal_count'].tolist() == [2, 1]
+    assert groups['processor_count'].tolist() == [1, 2]
+    # Matching follows the legacy engine: a reference pairs with its last internal row
+    assert groups['matched_pairs'].tolist() == [0, 1]
+    assert groups['internal_unmatched'].tolist() == [2, 0]
+    assert groups['processor_unmatched'].tolist() == [1, 0]
+    assert groups['internal_value'].tolist() == [4, 2]
+    assert groups['processor_value'].tolist() == [1, 7]
+    assert app.result_set_links(module, currency, 'vectorized', result)['duplicate_groups']['count'] == 2
@@ -0,0 +1,55 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.fixture
+def snapshot_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'SNAPSHOTS_ENABLED', True)
+    monkeypatch.setattr(app, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    return tmp_path / 'snapshots'
+
+
+def save(key, references, age):
+    frame = pd.DataFrame({'reference_number': references, 'amount': [1.0] * len(references)})
+    dataset = app.save_snapshot(key, app.build_dataset(frame, 'KES'))
+    os.utime(os.path.join(app.SNAPSHOT_DIR, key), (age, age))
+    return dataset
+
+
+def test_prune_keeps_the_newest_and_referenced_snapshots(snapshot_dir, monkeypatch):
+    monkeypatch.setattr(app, 'SNAPSHOT_RETENTION', 1)
+    old, middle, new = ('0' * 63 + digit for digit in '123')
+    save(old, ['A'], 1000)
+    save(middle, ['B'], 2000)
+    save(new, ['C'], 3000)
+
+    assert app.prune_snapshots({old}) == [middle]
+    assert sorted(os.listdir(snapshot_dir)) == [old, new]
+
+
+def test_sqlite_references_cover_snapshotted_uploads(snapshot_dir, tmp_path):
+    storage = app.SQLiteStorage(str(tmp_path / 'reconciliation.db'))
+    snapshotted = save('a' * 64, ['A'], 1000)
+    inline = app.build_dataset(pd.DataFrame({'reference_number': ['B'], 'amount': [2.0]}), 'KES', 'mpesa')
+    storage.set_internal(app.MODULES[0], 'KES', [snapshotted])
+    storage.append_processor(app.MODULES[0], 'KES', [inline])
+
+    assert storage.snapshot_references() == {'a' * 64}
+
+
+def test_snapshot_key_follows_currency_decimals(snapshot_dir, storage, monkeypatch):
+    client = app.app.test_client()
+
+    def upload():
+        data = {'module': app.MODULES[0], 'currency': 'KES', 'file': (io.BytesIO(b'reference_number,amount\nA,1.5\n'), 'a.csv')}
+        assert client.post('/upload/internal', data=data).status_code == 200
+        return storage.get_slot(app.MODULES[0], 'KES')['internal']['amount_minor'].tolist()
+
+    assert upload() == [150]
+    monkeypatch.setitem(app.CURRENCY_DECIMALS, 'KES', 3)
+    assert upload() == [1500]
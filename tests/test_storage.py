@@ -0,0 +1,80 @@
+import pickle
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+MODULE, CURRENCY = app.MODULES[0], app.CURRENCIES[0]
+
+
+def statement():
+    frame = pd.DataFrame({
+        'reference_number': ['A', None, ' b ', 'A'],
+        'amount': [1.5, np.nan, 2, 3],
+        'description': ['Card', None, 'Refund', 'Card'],
+        'transaction_date': ['2024-01-01', None, '2024-02-03', '2024-02-04']
+    })
+    return app.build_dataset(frame, CURRENCY, 'mpesa')
+
+
+def test_sqlite_batches_round_trip_without_pickle(tmp_path):
+    dataset = statement()
+    app.SQLiteStorage(str(tmp_path / 'reconciliation.db')).append_processor(MODULE, CURRENCY, [dataset])
+
+    (data,), = sqlite3.connect(tmp_path / 'reconciliation.db').execute('SELECT data FROM upload_batches')
+    # A fresh storage has no frames cached, so the slot comes from the stored blob
+    loaded = app.SQLiteStorage(str(tmp_path / 'reconciliation.db')).get_slot(MODULE, CURRENCY)['processor_data']
+
+    assert data[:2] == b'PK'
+    with np.load(app.io.BytesIO(data), allow_pickle=False) as arrays:
+        assert all(arrays[name].dtype != object for name in arrays.files)
+    pd.testing.assert_frame_equal(loaded, dataset)
+
+
+def test_column_dictionaries_that_are_not_text_are_stored_as_json():
+    frame = pd.DataFrame({'mixed': np.array(['a', 7, 2.5, None, 'x\x00y'], dtype=object)})
+
+    spec, codes, text = app.encode_column(frame['mixed'])
+
+    assert spec == {'kind': 'text', 'dictionary': 'json', 'size': 4}
+    assert app.decode_column(spec, codes, text).tolist() == ['a', 7, 2.5, None, 'x\x00y']
+    with pytest.raises(TypeError):
+        app.encode_column(pd.Series([pd.Timestamp('2024-01-01')], dtype=object, name='stamp'))
+
+
+def test_pickled_batches_load_only_after_migration(tmp_path, monkeypatch):
+    path = str(tmp_path / 'reconciliation.db')
+    dataset = statement()
+    app.SQLiteStorage(path).append_processor(MODULE, CURRENCY, [dataset])
+    with sqlite3.connect(path) as connection:
+        # The format earlier versions wrote
+        connection.execute('UPDATE upload_batches SET data = ?', (pickle.dumps(dataset),))
+
+    with pytest.raises(ValueError, match='RECON_MIGRATE_PICKLES'):
+        app.SQLiteStorage(path).get_slot(MODULE, CURRENCY)
+
+    monkeypatch.setattr(app, 'MIGRATE_PICKLES', True)
+    migrated = app.SQLiteStorage(path)
+
+    assert migrated.migrate_pickled_batches() == 0
+    pd.testing.assert_frame_equal(migrated.get_slot(MODULE, CURRENCY)['processor_data'], dataset)
+
+
+def test_pickled_snapshot_markers_stay_referenced_until_migrated(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'SNAPSHOT_DIR', str(tmp_path / 'snapshots'))
+    path = str(tmp_path / 'reconciliation.db')
+    key = 'c' * 64
+    app.SQLiteStorage(path).set_internal(MODULE, CURRENCY, [app.save_snapshot(key, statement())])
+    with sqlite3.connect(path) as connection:
+        connection.execute('UPDATE upload_batches SET data = ?', (pickle.dumps({'snapshot': key}),))
+
+    assert app.SQLiteStorage(path).snapshot_references() == {key}
+
+    monkeypatch.setattr(app, 'MIGRATE_PICKLES', True)
+    migrated = app.SQLiteStorage(path)
+
+    assert migrated.snapshot_references() == {key}
+    assert migrated.get_slot(MODULE, CURRENCY)['internal'].attrs['snapshot'] == key